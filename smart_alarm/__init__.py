@@ -0,0 +1,28 @@
+# Smart Alarm: unsupervised anomaly detection on animal behavioural data
+# importing the package only loads numpy and pandas; statsmodels, R (rpy2), keras and the plotting 
+# libraries are loaded the first time something needs them
+from .core import RigAlarm, N_COMP, W_WIDTH, COMP_THRESHOLD, KEY_FEATURES, META_COLUMNS
+from .foreca import whiten_array, mvspectrum, spectral_omega, foreca_em, foreca_numpy
+from .forecast import arima_batch
+from .store import ForeCAModelStore
+from .sessions import SessionStore, subject_sessions
+from .shared import SharedColony
+from .colony import run_colony, run_subject
+from .streaming import AlarmService
+from .metrics import Metrics
+from .results import SessionResult, ResultLog
+from .cohort import CohortModel, fit_cohorts
+from .preprocess import Preprocessor
+from .alerts import AlertDispatcher, FileSink, SMTPSink, WebhookSink, make_alert
+from .scoring import score_sessions, score_rigalarm
+
+# these pull in tqdm / matplotlib / seaborn / sklearn, so they are imported on first access
+LAZY_NAMES = {'rolling_pred': 'backtest', 'collect_walk_forward': 'backtest', 'find_outliers': 'backtest', 'find_anomalies': 'backtest', 
+              'compare_foreca_backends': 'backtest', 'run_sweep': 'sweep', 'label_plot': 'plotting', 'plot_feature_dist': 'plotting', 
+              'plot_dim_reducers': 'plotting', 'plot_rolling_pred': 'plotting', 'plot_result_log': 'plotting'}
+
+def __getattr__(name):
+  if name in LAZY_NAMES:
+    import importlib
+    return getattr(importlib.import_module('.' + LAZY_NAMES[name], __name__), name)
+  raise AttributeError('module {} has no attribute {}'.format(__name__, name))
@@ -0,0 +1,68 @@
+# command line entry point, e.g. for the nightly cron job:
+#   python -m smart_alarm sessions.csv --workers 8 --backend numpy --forecaster batch --model-store models/
+# or as a long-lived service scoring the sessions piped in as json lines:
+#   python -m smart_alarm sessions.csv --serve
+# anomalies go out through an AlertDispatcher with --alert-file and / or --alert-webhook
+import sys
+import argparse
+import pandas as pd
+
+from .colony import run_colony
+from .store import ForeCAModelStore
+from .streaming import AlarmService
+from .alerts import AlertDispatcher, FileSink, WebhookSink
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(prog = 'smart_alarm', description = 'Anomaly detection on animal session data')
+  parser.add_argument('sessions', help = 'csv export of the session table')
+  parser.add_argument('--workers', type = int, default = 4)
+  parser.add_argument('--pred-index', type = int, default = None, help = 'first session to score, -horizon by default')
+  parser.add_argument('--horizon', type = int, default = 1, help = 'score this many sessions from pred-index on')
+  parser.add_argument('--backend', default = 'numpy', choices = ['numpy', 'r'])
+  parser.add_argument('--forecaster', default = 'batch', choices = ['batch', 'statsmodels'])
+  parser.add_argument('--model-store', default = None, help = 'directory of cached ForeCA models')
+  parser.add_argument('--report', default = None, help = 'write the colony report to this csv instead of stdout')
+  parser.add_argument('--serve', action = 'store_true', help = 'score json lines from stdin after loading the history')
+  parser.add_argument('--watch', default = None, help = 'with --serve, watch this directory instead of stdin')
+  parser.add_argument('--alert-file', default = None, help = 'append the anomalies to this file as json lines')
+  parser.add_argument('--alert-webhook', default = None, help = 'POST the anomalies to this url')
+  args = parser.parse_args(argv)
+  if args.serve and args.horizon != 1:
+    parser.error('--horizon does not apply to --serve, the sessions are scored one at a time as they arrive')
+  if args.pred_index is None: # the last horizon sessions
+    args.pred_index = -args.horizon
+  elif args.pred_index + args.horizon > 0:
+    parser.error('--pred-index {} leaves fewer than --horizon {} sessions to score'.format(args.pred_index, args.horizon))
+
+  df = pd.read_csv(args.sessions)
+  ra_kwargs = {'backend': args.backend, 'forecaster': args.forecaster, 'horizon': args.horizon}
+  if args.model_store is not None:
+    ra_kwargs['model_store'] = ForeCAModelStore(args.model_store)
+
+  sinks = []
+  if args.alert_file is not None:
+    sinks.append(FileSink(args.alert_file))
+  if args.alert_webhook is not None:
+    sinks.append(WebhookSink(args.alert_webhook))
+  alerts = AlertDispatcher(sinks).start_background() if sinks else None
+
+  try:
+    if args.serve:
+      service = AlarmService(alerts = alerts, **ra_kwargs)
+      service.bootstrap_colony(df)
+      if args.watch is not None:
+        service.watch_directory(args.watch)
+      else:
+        service.serve_jsonl(sys.stdin)
+      return
+    report = run_colony(df, workers = args.workers, pred_index = args.pred_index, alerts = alerts, **ra_kwargs)
+  finally:
+    if alerts is not None: # send what is still queued
+      alerts.close()
+  if args.report is not None:
+    report.to_csv(args.report, index = False)
+  else:
+    print(report.to_string())
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,191 @@
+# alert pipeline: RigAlarm decisions go into an asyncio dispatcher that batches them, drops repeated alarms
+# for the same rig or subject and hands them to the sinks (file, SMTP, webhook), each at its own pace
+# submit() never blocks: every sink has a bounded queue and when a slow sink falls behind its oldest alerts
+# are dropped (and counted), so notification can never stall the detection loop
+import json
+import math
+import time
+import asyncio
+import smtplib
+import threading
+import urllib.request
+from email.message import EmailMessage
+
+from .metrics import Metrics
+
+def to_json(alert):
+  return json.dumps(alert, default = lambda x: x.item() if hasattr(x, 'item') else str(x))
+
+def make_alert(subjid, sessiondate, is_anomaly, outlier_comp, abs_conf_diff, diff_df = None, rigid = None):
+  # one alert, the fields of a RigAlarm decision (outlier_comp, abs_conf_diff_, diff_df) as plain json types
+  # diff is the % change of the session features compared to the session before (None where it is not finite, x/0)
+  diff = None
+  if diff_df is not None:
+    diff = {str(name): float(value) if math.isfinite(value) else None for name, value in diff_df.iloc[:, 0].items()}
+  return {'ts': time.time(), 'subjid': subjid, 'rigid': rigid, 'sessiondate': sessiondate,
+          'is_anomaly': bool(is_anomaly), 'outlier_comp': [int(c) for c in outlier_comp],
+          'abs_conf_diff': [float(a) for a in abs_conf_diff], 'diff': diff}
+
+class FileSink:
+    # appends the alerts to a file as json lines
+    name = 'file'
+    def __init__(self, path):
+      self.path = path
+
+    async def send(self, alerts):
+      await asyncio.to_thread(self.write, alerts)
+
+    def write(self, alerts):
+      with open(self.path, 'a') as f:
+        for alert in alerts:
+          f.write(to_json(alert) + '\n')
+
+class SMTPSink:
+    # one email per batch, through a local SMTP server (e.g. the debugging server: python -m aiosmtpd -n -l localhost:1025)
+    name = 'smtp'
+    def __init__(self, host = 'localhost', port = 1025, sender = 'smart-alarm@localhost',
+                 recipients = ['lab@localhost'], timeout = 10):
+      self.host = host
+      self.port = port
+      self.sender = sender
+      self.recipients = recipients
+      self.timeout = timeout
+
+    async def send(self, alerts):
+      await asyncio.to_thread(self.write, alerts)
+
+    def write(self, alerts):
+      message = EmailMessage()
+      message['Subject'] = 'Smart Alarm: {} anomalies'.format(len(alerts))
+      message['From'] = self.sender
+      message['To'] = ', '.join(self.recipients)
+      message.set_content('\n'.join('Subject {} on rig {}: {} ({} outlier components)'.format(
+          alert['subjid'], alert['rigid'], alert['sessiondate'], len(alert['outlier_comp'])) for alert in alerts)
+          + '\n\n' + '\n'.join(to_json(alert) for alert in alerts))
+      with smtplib.SMTP(self.host, self.port, timeout = self.timeout) as server:
+        server.send_message(message)
+
+class WebhookSink:
+    # POSTs each batch as a json list, e.g. to the lab dashboard running on the same machine
+    name = 'webhook'
+    def __init__(self, url = 'http://localhost:8080/alerts', timeout = 10):
+      self.url = url
+      self.timeout = timeout
+
+    async def send(self, alerts):
+      await asyncio.to_thread(self.write, alerts)
+
+    def write(self, alerts):
+      body = ('[' + ','.join(to_json(alert) for alert in alerts) + ']').encode()
+      request = urllib.request.Request(self.url, data = body, headers = {'Content-Type': 'application/json'})
+      with urllib.request.urlopen(request, timeout = self.timeout) as response:
+        response.read()
+
+class AlertDispatcher:
+    def __init__(self, sinks, batch_size = 50, flush_interval = 1.0, max_queue = 1000,
+                 dedup_seconds = 12 * 3600, dedup_by = ('subjid', 'rigid'), only_anomalies = True, metrics = None):
+      # sinks: objects with async send(alerts) (a list) and a name
+      # a sink gets up to batch_size alerts at once, or whatever came in during flush_interval seconds
+      # an alert is dropped as a repeat if an alert with the same value of any dedup_by field went out
+      # in the last dedup_seconds (e.g. one broken rig alarms for every subject on it)
+      self.sinks = sinks
+      self.batch_size = batch_size
+      self.flush_interval = flush_interval
+      self.max_queue = max_queue
+      self.dedup_seconds = dedup_seconds
+      self.dedup_by = dedup_by
+      self.only_anomalies = only_anomalies
+      self.metrics = Metrics() if metrics is None else metrics
+      self.last_alarm = {} # (field, value) -> time of the last alert
+      self.loop = None
+      self.thread = None
+
+    async def start(self):
+      # start one worker per sink on the running event loop
+      self.loop = asyncio.get_running_loop()
+      self.queues = [asyncio.Queue() for _ in self.sinks]
+      self.workers = [asyncio.create_task(self.drain(sink, queue)) for sink, queue in zip(self.sinks, self.queues)]
+
+    async def stop(self):
+      # send what is still queued, then stop the workers
+      for queue in self.queues:
+        await queue.join()
+      for worker in self.workers:
+        worker.cancel()
+      await asyncio.gather(*self.workers, return_exceptions = True)
+
+    async def __aenter__(self):
+      await self.start()
+      return self
+
+    async def __aexit__(self, *exc_info):
+      await self.stop()
+
+    def start_background(self):
+      # for synchronous detection code: run the dispatcher on its own event loop in a daemon thread
+      started = threading.Event()
+      def serve():
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(self.start())
+        started.set()
+        loop.run_forever()
+      self.thread = threading.Thread(target = serve, name = 'smart-alarm-alerts', daemon = True)
+      self.thread.start()
+      started.wait()
+      return self
+
+    def close(self):
+      # flush and stop the background thread started by start_background
+      asyncio.run_coroutine_threadsafe(self.stop(), self.loop).result()
+      self.loop.call_soon_threadsafe(self.loop.stop)
+      self.thread.join()
+      self.loop.close()
+
+    def submit(self, alert):
+      # hand over an alert (see make_alert), from the event loop or any other thread, without blocking
+      if self.loop is None:
+        raise RuntimeError('The dispatcher is not running, call start() or start_background() first')
+      self.loop.call_soon_threadsafe(self.enqueue, alert)
+
+    def enqueue(self, alert):
+      # runs on the event loop
+      if self.only_anomalies and not alert['is_anomaly']:
+        return
+      now = time.time()
+      keys = [(field, alert.get(field)) for field in self.dedup_by if alert.get(field) is not None]
+      if any(now - self.last_alarm.get(key, -float('inf')) < self.dedup_seconds for key in keys):
+        self.metrics.emit('alert', subjid = alert['subjid'], status = 'deduplicated', sink = None)
+        return
+      for key in keys:
+        self.last_alarm[key] = now
+      for sink, queue in zip(self.sinks, self.queues):
+        if queue.qsize() >= self.max_queue: # backpressure: this sink is behind, drop its oldest alert
+          dropped = queue.get_nowait()
+          queue.task_done()
+          self.metrics.emit('alert', subjid = dropped['subjid'], status = 'dropped', sink = sink.name)
+        queue.put_nowait(alert)
+
+    async def drain(self, sink, queue):
+      # the worker of one sink: collect a batch, send it, repeat
+      while True:
+        batch = [await queue.get()]
+        deadline = self.loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+          if queue.empty():
+            timeout = deadline - self.loop.time()
+            if timeout <= 0:
+              break
+            try:
+              batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+              break
+          else:
+            batch.append(queue.get_nowait())
+        try:
+          await sink.send(batch)
+          status = 'sent'
+        except Exception as e: # a failing sink loses this batch, the others carry on
+          status = 'error: {}: {}'.format(type(e).__name__, e)
+        for alert in batch:
+          self.metrics.emit('alert', subjid = alert['subjid'], status = status, sink = sink.name)
+          queue.task_done()
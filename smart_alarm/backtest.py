@@ -0,0 +1,93 @@
+import numpy as np
+import tqdm
+
+from .core import RigAlarm, N_COMP, COMP_THRESHOLD
+from .forecast import MIN_FIXED_HISTORY
+from .sessions import subject_sessions
+from .scoring import outlier_votes, score_rigalarm
+from .results import ResultLog
+
+# check that the native ForeCA agrees with the R one on the example data
+# components are only defined up to their sign, so we compare absolute correlations
+def compare_foreca_backends(sess_df, n_comp = N_COMP, spectrum_method = 'mvspec'):
+  # the numpy backend uses the same spectrum estimate as R by default, so only the optimisation can differ
+  ra_r = RigAlarm(sess_df.subjid.iloc[0], n_comp = n_comp, backend = 'r')
+  ra_np = RigAlarm(sess_df.subjid.iloc[0], n_comp = n_comp, backend = 'numpy', spectrum_method = spectrum_method)
+  ra_r.foreCA(ra_r.preprocess(sess_df))
+  ra_np.foreCA(ra_np.preprocess(sess_df))
+  score_corr = np.array([np.abs(np.corrcoef(ra_r.foreca_scores_[:,comp], ra_np.foreca_scores_[:,comp])[0,1]) 
+                         for comp in range(n_comp)])
+  omega_diff = np.abs(ra_r.foreca_omegas_ - ra_np.foreca_omegas_)
+  return score_corr, omega_diff
+
+def collect_walk_forward(ra, method = 'arima', progress = False):
+  # run RigAlarm.walk_forward into preallocated arrays, oldest session first
+  # returns pred_index, y_true, y_pred, y_low, y_high, converged
+  min_history = MIN_FIXED_HISTORY if method == 'arima' and ra.cohort_model() is not None else ra.w_width # see walk_forward
+  n_pred = max(ra.foreca_scores_.shape[0] - min_history, 0)
+  pred_index = np.zeros(n_pred, dtype = int)
+  y_true, y_pred, y_low, y_high = [np.zeros((n_pred, ra.n_comp)) for _ in range(4)]
+  converged = np.zeros((n_pred, ra.n_comp), dtype = bool)
+  steps = ra.walk_forward(method = method)
+  if progress:
+    steps = tqdm.tqdm(steps, total = n_pred)
+  for j, step in enumerate(steps):
+    pred_index[j], y_true[j], y_pred[j], y_low[j], y_high[j], converged[j] = step
+  return pred_index, y_true, y_pred, y_low, y_high, converged
+
+# Compute root mean squared error (RMSE) and store the prediction results using rolling window predictions
+# given the session table (or a SessionStore), the subject list and method (ARIMA or LSTM)
+
+def rolling_pred(df, subj_list, method = 'arima', result_log = None, **ra_kwargs):
+  # ra_kwargs are passed on to RigAlarm, e.g. backend = 'numpy', forecaster = 'batch'
+  # every predicted session is scored and appended to result_log (a ResultLog), the arrays returned 
+  # for plotting are those of the last subject, read back from the log
+  rmse = np.zeros((len(subj_list), N_COMP))
+  last = None
+  for i, subj in enumerate(subj_list):
+    # initialise RigAlarm class for each subject
+    ra = RigAlarm(subj, **ra_kwargs)
+    sess_df = subject_sessions(df, subj)
+    if sess_df.shape[0] < ra.w_width and ra.cohort is None: # just in case this subject has too little data
+      continue
+    sess_array = ra.preprocess(sess_df)
+    ra.fit_or_project(sess_array, sess_df.loc[ra.clean_df.index, 'sessid'].to_numpy())
+
+    # walk forward over every session that has a full window before it, oldest first
+    pred_index, y_true, y_pred, conf_low, conf_high, converged = collect_walk_forward(ra, method, progress = True)
+    scores = score_rigalarm(ra, pred_index, y_true, conf_low, conf_high, converged)
+    if result_log is None:
+      result_log = ResultLog(n_comp = ra.n_comp, capacity = len(subj_list) * len(pred_index))
+    rows = pred_index + ra.clean_df.shape[0]
+    clean_sessions = sess_df.loc[ra.clean_df.index]
+    start = len(result_log)
+    result_log.extend(subj, clean_sessions.sessid.to_numpy()[rows], clean_sessions.sessiondate.to_numpy()[rows], rows,
+                      y_true, y_pred, conf_low, conf_high, converged, scores['outliers'], scores['conf_dist'], 
+                      scores['is_anomaly'], scores['max_pct_change'])
+    last = result_log.table[start:]
+
+    # compute RMSE of all foreCA components     
+    rmse[i] = np.sqrt(np.mean((last['y_true'] - last['y_pred']) ** 2, axis = 0))
+  
+  # get the population RMSE stats
+  rmse_mean = np.mean(rmse, axis=0)
+  rmse_std = np.std(rmse, axis=0)
+
+  return rmse_mean, rmse_std, last['y_true'], last['y_pred'], last['y_low'], last['y_high']
+
+# find outliers given a component
+def find_outliers(y_true, conf_low, conf_high, comp=0):
+  y_true_c = y_true[:,comp]
+  conf_low_c = conf_low[:,comp]
+  conf_high_c = conf_high[:,comp]
+
+  low_outliers_x = np.where(y_true_c < conf_low_c)
+  high_outliers_x = np.where(y_true_c > conf_high_c)
+  outliers_x = np.append(low_outliers_x, high_outliers_x)
+  outliers_y = y_true_c[outliers_x]
+  return outliers_x, outliers_y 
+
+# find anomalies combining the votes from all components
+def find_anomalies(y_true, conf_low, conf_high, comp_threshold=COMP_THRESHOLD):
+  _, _, votes = outlier_votes(y_true[:, :N_COMP], conf_low[:, :N_COMP], conf_high[:, :N_COMP])
+  return np.where(votes > comp_threshold)[0] # return the index of anomalies 
@@ -0,0 +1,132 @@
+# benchmark harness: times every pipeline stage on the example data and on synthetic colonies
+# and writes the numbers (plus detection recall on the injected anomalies) as json, e.g.
+#   python -m smart_alarm.benchmark --example example_sessdata.csv --out bench.json
+import io
+import json
+import time
+import argparse
+import tracemalloc
+import contextlib
+import numpy as np
+import pandas as pd
+
+from .core import RigAlarm
+from .backtest import rolling_pred, collect_walk_forward
+from .scoring import score_rigalarm
+from .synthetic import make_colony
+
+def measure(fn, repeat = 3):
+  # best wall time over repeat calls and peak traced memory of one call (numpy allocations are traced)
+  times = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()): # RigAlarm.run prints
+      fn()
+    times.append(time.perf_counter() - start)
+  tracemalloc.start()
+  with contextlib.redirect_stdout(io.StringIO()):
+    fn()
+  _, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  return {'seconds': min(times), 'peak_mb': peak / 2 ** 20}
+
+def benchmark_stages(df, ra_kwargs, repeat = 3):
+  # time each stage separately, summed over all subjects of df
+  # throughput is in subject-sessions per second (for rolling_pred: sessions predicted per second)
+  results = {}
+  subjects = [(subj, sess_df) for subj, sess_df in df.groupby('subjid', sort = True)]
+  n_sessions = sum(sess_df.shape[0] for _, sess_df in subjects)
+
+  # fitted RigAlarms to time the later stages on their own
+  fitted = []
+  for subj, sess_df in subjects:
+    ra = RigAlarm(subj, **ra_kwargs)
+    clean_array = ra.preprocess(sess_df)
+    ra.foreCA(clean_array)
+    ra.arima_predict()
+    fitted.append((ra, sess_df, clean_array))
+
+  stages = {'preprocess': lambda: [ra.preprocess(sess_df) for ra, sess_df, _ in fitted],
+            'foreCA': lambda: [ra.foreCA(clean_array) for ra, _, clean_array in fitted],
+            'arima_predict': lambda: [ra.arima_predict() for ra, _, _ in fitted],
+            'detect_outliers': lambda: [ra.detect_outliers() for ra, _, _ in fitted],
+            'run': lambda: [RigAlarm(subj, **ra_kwargs).run(sess_df) for subj, sess_df in subjects]}
+  for name, fn in stages.items():
+    results[name] = measure(fn, repeat)
+    results[name]['subject_sessions_per_s'] = n_sessions / results[name]['seconds']
+
+  n_pred = sum(max(ra.foreca_scores_.shape[0] - ra.w_width, 0) for ra, _, _ in fitted)
+  results['rolling_pred'] = measure(lambda: rolling_pred(df, [subj for subj, _ in subjects], **ra_kwargs), 1)
+  results['rolling_pred']['predictions_per_s'] = n_pred / results['rolling_pred']['seconds']
+  results['n_subjects'] = len(subjects)
+  results['n_sessions'] = n_sessions
+  return results
+
+def detection_scores(df, labels, ra_kwargs):
+  # walk forward over every subject, score every predicted session (same decisions as detect_outliers)
+  # and compare with the injected anomalies
+  detected = []
+  for subj, sess_df in df.groupby('subjid', sort = True):
+    ra = RigAlarm(subj, **ra_kwargs)
+    clean_array = ra.preprocess(sess_df)
+    if clean_array.shape[0] <= ra.w_width:
+      continue
+    ra.foreCA(clean_array)
+    sessids = sess_df.loc[ra.clean_df.index, 'sessid'].to_numpy()
+    pred_index, y_true, _, y_low, y_high, converged = collect_walk_forward(ra)
+    scores = score_rigalarm(ra, pred_index, y_true, y_low, y_high, converged)
+    detected.append(pd.DataFrame({'sessid': sessids[pred_index], 'detected': scores['is_anomaly']}))
+  detected = pd.concat(detected, ignore_index = True)
+  scored = detected.merge(labels, on = 'sessid')
+  true_pos = np.sum(scored.detected & scored.is_anomaly)
+  return {'n_scored': len(scored), 'n_anomalies': int(scored.is_anomaly.sum()), 'n_detected': int(scored.detected.sum()),
+          'recall': true_pos / max(scored.is_anomaly.sum(), 1), 'precision': true_pos / max(scored.detected.sum(), 1)}
+
+def scaling_curves(ra_kwargs, subject_counts, session_counts, n_features, seed = 0):
+  # time RigAlarm.run over synthetic colonies of growing size
+  curves = []
+  for n_subjects in subject_counts:
+    for n_sessions in session_counts:
+      df, _ = make_colony(n_subjects, n_sessions, n_features, seed = seed)
+      run = lambda: [RigAlarm(subj, **ra_kwargs).run(sess_df) for subj, sess_df in df.groupby('subjid')]
+      timing = measure(run, 1)
+      curves.append({'n_subjects': n_subjects, 'n_sessions': n_sessions, 'n_features': n_features, 
+                     'seconds': timing['seconds'], 'peak_mb': timing['peak_mb'],
+                     'subject_sessions_per_s': n_subjects * n_sessions / timing['seconds']})
+  return curves
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(prog = 'smart_alarm.benchmark')
+  parser.add_argument('--example', default = None, help = 'csv export to benchmark, e.g. example_sessdata.csv')
+  parser.add_argument('--subjects', type = int, default = 8)
+  parser.add_argument('--sessions', type = int, default = 300)
+  parser.add_argument('--features', type = int, default = 14)
+  parser.add_argument('--anomaly-rate', type = float, default = 0.02)
+  parser.add_argument('--backend', default = 'numpy', choices = ['numpy', 'r'])
+  parser.add_argument('--forecaster', default = 'batch', choices = ['batch', 'statsmodels'])
+  parser.add_argument('--repeat', type = int, default = 3)
+  parser.add_argument('--scaling-subjects', default = '1,4,16')
+  parser.add_argument('--scaling-sessions', default = '150,300,600')
+  parser.add_argument('--seed', type = int, default = 0)
+  parser.add_argument('--out', default = None, help = 'json file, stdout if not given')
+  args = parser.parse_args(argv)
+
+  ra_kwargs = {'backend': args.backend, 'forecaster': args.forecaster}
+  report = {'config': vars(args)}
+  if args.example is not None:
+    report['example'] = benchmark_stages(pd.read_csv(args.example), ra_kwargs, args.repeat)
+  df, labels = make_colony(args.subjects, args.sessions, args.features, args.anomaly_rate, seed = args.seed)
+  report['synthetic'] = benchmark_stages(df, ra_kwargs, args.repeat)
+  report['synthetic']['detection'] = detection_scores(df, labels, ra_kwargs)
+  report['scaling'] = scaling_curves(ra_kwargs, [int(n) for n in args.scaling_subjects.split(',')], 
+                                     [int(n) for n in args.scaling_sessions.split(',')], args.features, args.seed)
+
+  out = json.dumps(report, indent = 1, default = float)
+  if args.out is None:
+    print(out)
+  else:
+    with open(args.out, 'w') as f:
+      f.write(out)
+
+if __name__ == "__main__":
+  main()
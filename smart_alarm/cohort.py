@@ -0,0 +1,134 @@
+# cohort models: one ForeCA fit per protocol / expgroup on the pooled sessions of its subjects
+# all the subjects are projected through the shared loadings at once, and the cohort's ARIMA parameters
+# (the median over its subjects) forecast the subjects whose history is shorter than w_width and warm-start
+# the others, so there is one fit per cohort and a new subject is scored from its third session on (the
+# first forecast needs two sessions)
+# use: RigAlarm(subjid, cohort = fit_cohorts(df)), or run_colony(df, cohort = fit_cohorts(df))
+import logging
+import numpy as np
+
+from .core import RigAlarm, N_COMP, W_WIDTH, cohort_key
+from .foreca import full_rank_columns, mvspectrum, foreca_loadings
+from .forecast import arima_batch, arima_fixed
+
+logger = logging.getLogger(__name__)
+
+class CohortModel:
+    def __init__(self, n_comp = N_COMP, w_width = W_WIDTH, n_steps = 3, nperseg = 32, rank_tol = 1e-5,
+                 n_init = 10, seed = 0):
+      self.n_comp = n_comp
+      self.w_width = w_width # the cohort forecaster is learnt on the last w_width sessions of each subject
+      self.n_steps = n_steps
+      self.nperseg = nperseg # segment length of the pooled spectrum, shorter subjects only count for the whitening
+      self.rank_tol = rank_tol
+      self.n_init = n_init
+      self.seed = seed
+
+    def fit(self, sessions):
+      # sessions: the session table of the cohort (any number of subjects)
+      arrays = []
+      for subjid, sess_df in sessions.groupby('subjid', sort = True):
+        ra = RigAlarm(subjid)
+        arrays.append(ra.preprocess(sess_df))
+      self.feature_names = list(ra.clean_df.columns)
+      self.n_subjects = len(arrays)
+      self.n_sessions = sum(a.shape[0] for a in arrays)
+
+      # each subject around its own mean, so the differences in level between subjects do not count
+      centered = [a.astype('float64') - a.mean(axis = 0) for a in arrays]
+      within = np.concatenate(centered)
+      self.kept_columns_ = full_rank_columns(within, self.rank_tol)
+      self.dropped_features_ = [name for i, name in enumerate(self.feature_names) if i not in self.kept_columns_]
+      within = within[:, self.kept_columns_]
+
+      # ZCA whitening from the pooled within-subject covariance
+      cov = within.T @ within / (within.shape[0] - len(arrays))
+      values, vectors = np.linalg.eigh(cov)
+      whitening = (vectors / np.sqrt(values)) @ vectors.T
+
+      # pooled spectrum: the subjects' spectra on a common frequency grid, weighted by their length
+      spectra = [(c.shape[0], mvspectrum(c[:, self.kept_columns_] @ whitening, nperseg = self.nperseg))
+                 for c in centered if c.shape[0] >= self.nperseg]
+      if not spectra:
+        raise ValueError('No subject of the cohort has nperseg = {} sessions'.format(self.nperseg))
+      spec = sum(n * s for n, s in spectra) / sum(n for n, _ in spectra)
+      self.foreca_loadings_, self.foreca_omegas_, self.foreca_order_ = foreca_loadings(
+          spec, self.n_comp, n_init = self.n_init, seed = self.seed)
+
+      # the map from the clean features to the scores, 0 weight for the dropped features
+      self.foreca_center_ = np.concatenate(arrays).mean(axis = 0).astype('float64')
+      self.foreca_projection_ = np.zeros((len(self.feature_names), self.n_comp))
+      self.foreca_projection_[self.kept_columns_] = whitening @ self.foreca_loadings_
+
+      # the cohort forecaster: median ARIMA parameters of the recent windows of the subjects that have one
+      params = [arima_batch(scores[-self.w_width:], self.n_steps)[4]
+                for scores in self.project_subjects(arrays) if scores.shape[0] >= self.w_width]
+      if not params:
+        raise ValueError('No subject of the cohort has w_width = {} sessions to learn the forecaster from'.format(self.w_width))
+      self.arima_params_ = {name: np.median([p[name] for p in params], axis = 0) for name in params[0]}
+      return self
+
+    def project_subjects(self, arrays):
+      # the scores of a list of clean feature arrays (one per subject), as one matrix product for all of them
+      offsets = np.cumsum([0] + [a.shape[0] for a in arrays])
+      scores = (np.concatenate(arrays) - self.foreca_center_) @ self.foreca_projection_
+      return [scores[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
+
+    def project_sessions(self, sessions):
+      # preprocess every subject of a session table and project them all at once, subjid -> scores
+      subjids, arrays = [], []
+      for subjid, sess_df in sessions.groupby('subjid', sort = True):
+        subjids.append(subjid)
+        arrays.append(RigAlarm(subjid).preprocess(sess_df))
+      return dict(zip(subjids, self.project_subjects(arrays)))
+
+    def apply(self, ra, clean_array):
+      # give a RigAlarm the shared model instead of fitting its own (what fit_or_project does with a cohort)
+      if list(ra.clean_df.columns) != self.feature_names:
+        raise ValueError('The features of subject {} do not match the cohort model'.format(ra.subjid))
+      ra.foreca_center_ = self.foreca_center_
+      ra.foreca_projection_ = self.foreca_projection_[:, :ra.n_comp]
+      ra.foreca_loadings_ = self.foreca_loadings_[:, :ra.n_comp]
+      ra.foreca_omegas_ = self.foreca_omegas_[:ra.n_comp]
+      ra.foreca_order_ = self.foreca_order_[:ra.n_comp]
+      ra.kept_columns_ = self.kept_columns_
+      ra.dropped_features_ = self.dropped_features_
+      ra.foreca_scores_ = ra.project(clean_array)
+
+    def params(self, n_comp):
+      # the cohort ARIMA parameters of the first n_comp components
+      return {name: value[:n_comp] for name, value in self.arima_params_.items()}
+
+    def forecast(self, training_scores, horizon = 1, alpha = 0.1):
+      # forecast a (short) history with the cohort parameters, same returns as arima_batch
+      return arima_fixed(training_scores, self.params(training_scores.shape[1]), horizon = horizon, alpha = alpha)
+
+    def warm_start(self, n_comp):
+      # start parameters for the statsmodels ARIMA of each component: drift, ar terms, ma term, sigma2
+      # statsmodels' trend is the mean of the differences, the batch const is the intercept of their regression
+      params = self.params(n_comp)
+      ar_sum = 1 - params['ar'].sum(axis = 1)
+      drift = np.where(np.abs(ar_sum) > 1e-3, params['const'] / np.where(ar_sum == 0, 1, ar_sum), params['const'])
+      return [np.concatenate([[drift[c]], params['ar'][c], [params['ma'][c], params['sigma'][c] ** 2]]) for c in range(n_comp)]
+
+def fit_cohorts(df, **cohort_kwargs):
+  # one CohortModel per protocol / expgroup of the session table, cohort key -> model
+  # every subject counts in the cohort it is in at its last session
+  # the wider groupings are fitted too: per protocol, key (protocol,), and the whole colony, key (), so a
+  # cohort that can't be fitted (e.g. only new animals) or was never seen falls back to them (see RigAlarm.cohort_model)
+  keys = {subjid: cohort_key(sess_df) for subjid, sess_df in df.groupby('subjid', sort = True)}
+  models, fitted = {}, {} # fitted: subjects -> model, wider groupings with the same subjects share it
+  for depth in range(max(len(key) for key in keys.values()), -1, -1):
+    for key in sorted(set(key[:depth] for key in keys.values())):
+      subjids = tuple(subjid for subjid, subj_key in keys.items() if subj_key[:depth] == key)
+      if subjids not in fitted:
+        try:
+          fitted[subjids] = CohortModel(**cohort_kwargs).fit(df[df.subjid.isin(subjids)])
+        except ValueError as e:
+          fitted[subjids] = None
+          logger.warning('Cohort %s (%d subjects) was not fitted, it falls back to a wider one: %s', key, len(subjids), e)
+      if fitted[subjids] is not None:
+        models[key] = fitted[subjids]
+  if () not in models:
+    raise ValueError('No cohort model could be fitted, not even on the whole colony')
+  return models
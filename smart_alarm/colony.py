@@ -0,0 +1,208 @@
+import os
+import time
+import shutil
+import tempfile
+import traceback
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import pandas as pd
+
+from .core import RigAlarm, N_COMP
+from .alerts import make_alert
+from .sessions import SessionStore
+from .shared import SharedColony
+from .metrics import Metrics
+
+# run the whole colony in parallel, one subject per task
+# subjects are independent, so they are fanned out over a process pool
+def colony_record(subjid, n_sessions, error = None):
+  # one row of the colony report, filled in by run_subject
+  return {'subjid': subjid, 'n_sessions': n_sessions, 'sessiondate': None, 'rigid': None, 'is_anomaly': False, 
+          'n_outlier_comp': 0, 'outlier_comp': [], 'abs_conf_diff': [], 'error': error}
+
+def scored_sessions(ra):
+  # the rows of the clean sessions a RigAlarm has scored (one, or horizon of them)
+  return slice(ra.pred_index, ra.pred_index + ra.horizon or None)
+
+def fill_records(record, ra, sessiondates, rigids = None):
+  # the results of a RigAlarm that has run, one report row per scored session (sessiondates, rigids)
+  if ra.horizon == 1:
+    decisions = [(ra.is_anomaly, ra.outlier_comp, ra.abs_conf_diff_)]
+  else:
+    decisions = zip(ra.horizon_anomaly_, ra.outlier_comp, ra.abs_conf_diff_)
+  if rigids is None:
+    rigids = [None] * len(sessiondates)
+  records = []
+  for sessiondate, rigid, (is_anomaly, outlier_comp, abs_conf_diff) in zip(sessiondates, rigids, decisions):
+    records.append(dict(record, sessiondate = sessiondate, rigid = rigid, is_anomaly = bool(is_anomaly), 
+                        n_outlier_comp = len(outlier_comp), outlier_comp = [int(c) for c in outlier_comp],
+                        abs_conf_diff = [float(a) for a in abs_conf_diff]))
+  return records
+
+def run_subject(subjid, sess_df, ra_kwargs):
+  # run RigAlarm on one subject and return its rows of the colony report (one per scored session), its events 
+  # and its SessionResults
+  # python errors are caught here, crashes of the worker itself (e.g. R segfaults) are handled in run_colony
+  # the events and results of the worker travel back with the records, run_colony merges them
+  record = colony_record(subjid, sess_df.shape[0])
+  records, results = [record], []
+  metrics = Metrics()
+  start = time.perf_counter()
+  try:
+    ra = RigAlarm(subjid, metrics = metrics, **ra_kwargs)
+    ra.run(sess_df)
+    clean_sessions = sess_df.loc[ra.clean_df.index].iloc[scored_sessions(ra)]
+    rigids = clean_sessions.rigid.tolist() if 'rigid' in clean_sessions.columns else None
+    records = fill_records(record, ra, clean_sessions.sessiondate.tolist(), rigids)
+    results = ra.result_ if ra.horizon > 1 else [ra.result_]
+  except Exception:
+    record['error'] = traceback.format_exc(limit = 3)
+  metrics.emit('subject', subjid = subjid, seconds = time.perf_counter() - start, error = record['error'])
+  return records, list(metrics.events), results
+
+def run_shared_subject(root, subjid, n_sessions, ra_kwargs):
+  # run_subject on the subject's rows of the SharedColony at root: only the path and the subjid are pickled,
+  # the clean features are a zero-copy view and the ForeCA scores are written back into the shared matrix
+  record = colony_record(subjid, n_sessions)
+  records, results = [record], []
+  metrics = Metrics()
+  start = time.perf_counter()
+  try:
+    colony = SharedColony.attach(root)
+    ra = RigAlarm(subjid, metrics = metrics, **ra_kwargs)
+    ra.clean_df = colony.subject_frame(subjid) # preprocessed when the colony was built
+    ra.cohort_key_ = colony.cohort_keys[int(subjid)]
+    ra.fit_or_project(colony.subject_features(subjid), colony.subject_sessids(subjid))
+    colony.subject_scores(subjid)[:, :ra.foreca_scores_.shape[1]] = ra.foreca_scores_
+    ra.arima_predict()
+    ra.detect_outliers()
+    records = fill_records(record, ra, colony.subject_sessiondates(subjid)[scored_sessions(ra)],
+                           colony.subject_rigids(subjid)[scored_sessions(ra)])
+    for session in records:
+      metrics.emit('anomaly', subjid = subjid, sessiondate = session['sessiondate'], 
+                   is_anomaly = session['is_anomaly'], n_outlier_comp = session['n_outlier_comp'])
+    sessions = pd.DataFrame({'sessid': colony.subject_sessids(subjid), 'sessiondate': colony.subject_sessiondates(subjid)},
+                            index = ra.clean_df.index)
+    results = ra.session_results(sessions)
+  except Exception:
+    record['error'] = traceback.format_exc(limit = 3)
+  metrics.emit('subject', subjid = subjid, seconds = time.perf_counter() - start, error = record['error'])
+  return records, list(metrics.events), results
+
+def run_colony(df, workers = 4, max_pending = None, mp_context = None, metrics = None, 
+               shared = False, shared_root = None, **ra_kwargs):
+  # df is the session table of the whole colony (or a SessionStore), ra_kwargs are passed on to RigAlarm
+  # only max_pending subjects (default 2 x workers) are in flight at once, so memory stays bounded
+  # if a worker process dies, the pool is rebuilt and the subjects that were in flight are retried 
+  # one at a time in their own pool, so only the subject that really crashes is reported as failed
+  # the events of every subject are merged into metrics (a Metrics) if given
+  # shared = True preprocesses the colony once into a SharedColony (in shared_root, or a temporary directory 
+  # that is removed at the end) and the workers attach to it instead of receiving pickled sessions
+  # alerts (an AlertDispatcher, it can't go to the workers) gets an alert for every scored session, submitted 
+  # here from the report as the subjects come back
+  # result_log (a ResultLog) gets the SessionResults of every subject, sent back by the workers like the events
+  # returns one report DataFrame, one row per subject (per scored session with horizon > 1)
+  alerts = ra_kwargs.pop('alerts', None)
+  result_log = ra_kwargs.pop('result_log', None)
+  if max_pending is None:
+    max_pending = 2 * workers
+  if shared:
+    created = shared_root is None
+    if created:
+      shared_root = tempfile.mkdtemp(prefix = 'smart_alarm_', dir = '/dev/shm' if os.path.isdir('/dev/shm') else None)
+    colony = SharedColony.build(df, shared_root, n_comp = ra_kwargs.get('n_comp', N_COMP), metrics = metrics)
+    groups = iter([(subjid, colony.n_sessions[subjid]) for subjid in colony.subjects()])
+    task = partial(run_shared_subject, shared_root)
+  else:
+    created = False
+    if isinstance(df, SessionStore): # subjects are already contiguous on disk
+      groups = df.groups()
+    else:
+      groups = iter(df.groupby('subjid', sort = True)) # a single pass over the table
+    task = run_subject
+  try:
+    report = run_tasks(task, groups, workers, max_pending, mp_context, metrics, ra_kwargs, alerts, result_log)
+  finally:
+    if created:
+      shutil.rmtree(shared_root, ignore_errors = True)
+  return report
+
+def submit_alerts(alerts, records):
+  # the alerts of the sessions of a subject that was scored without errors
+  for record in records:
+    if record['error'] is None:
+      alerts.submit(make_alert(record['subjid'], record['sessiondate'], record['is_anomaly'], 
+                               record['outlier_comp'], record['abs_conf_diff'], rigid = record['rigid']))
+
+def run_tasks(task, groups, workers, max_pending, mp_context, metrics, ra_kwargs, alerts = None, result_log = None):
+  # the process pool behind run_colony, task(subjid, item, ra_kwargs) is run for every (subjid, item) of groups
+  # (item is the subject's sessions, or their number in shared mode) and returns (records, events, results)
+  def crashed(subjid, sess_df):
+    n_sessions = sess_df if isinstance(sess_df, int) else sess_df.shape[0]
+    return ([colony_record(subjid, n_sessions, error = 'worker process crashed')],
+            [{'ts': time.time(), 'event': 'subject', 'subjid': subjid, 'seconds': 0.0, 'error': 'worker process crashed'}], [])
+
+  on_result = None if alerts is None else lambda result: submit_alerts(alerts, result[0])
+  results = run_pool(task, groups, workers, max_pending, mp_context, (ra_kwargs,), on_result, crashed)
+
+  records = []
+  for subject_records, events, session_results in sorted(results, key = lambda result: result[0][0]['subjid']):
+    records.extend(subject_records)
+    if metrics is not None:
+      metrics.extend(events)
+    if result_log is not None:
+      for session_result in session_results:
+        result_log.append(session_result)
+  return pd.DataFrame(records).sort_values(['subjid', 'sessiondate'], kind = 'stable').reset_index(drop = True)
+
+def run_pool(task, groups, workers, max_pending, mp_context, args = (), on_result = None, on_crash = None):
+  # run task(key, item, *args) for every (key, item) of groups in a process pool, with at most max_pending
+  # tasks in flight, and return the results in the order they come back (on_result is called on each as it does)
+  # if a worker process dies, the pool is rebuilt and the tasks that were in flight are retried one at a time
+  # in their own pool, a task that crashes that one too gets on_crash(key, item) as its result
+  # (python errors are not caught here, the task handles them)
+  results, crashed = [], []
+
+  def collect(result):
+    results.append(result)
+    if on_result is not None:
+      on_result(result)
+
+  pool = ProcessPoolExecutor(max_workers = workers, mp_context = mp_context)
+  pending = {}
+  try:
+    while True:
+      # top up the pool
+      for key, item in groups:
+        pending[pool.submit(task, key, item, *args)] = (key, item)
+        if len(pending) >= max_pending:
+          break
+      if not pending:
+        break
+      done, _ = wait(pending, return_when = FIRST_COMPLETED)
+      pool_broken = False
+      for future in done:
+        key, item = pending.pop(future)
+        try:
+          collect(future.result())
+        except BrokenProcessPool: 
+          crashed.append((key, item))
+          pool_broken = True
+      if pool_broken: # everything still in flight is lost with the pool
+        crashed.extend(pending.values())
+        pending = {}
+        pool.shutdown(wait = False)
+        pool = ProcessPoolExecutor(max_workers = workers, mp_context = mp_context)
+  finally:
+    pool.shutdown(wait = True)
+
+  # retry the tasks that were in a crashed pool, each on its own 
+  for key, item in crashed:
+    with ProcessPoolExecutor(max_workers = 1, mp_context = mp_context) as solo_pool:
+      try:
+        collect(solo_pool.submit(task, key, item, *args).result())
+      except BrokenProcessPool:
+        if on_crash is not None:
+          collect(on_crash(key, item))
+  return results
@@ -0,0 +1,557 @@
+import datetime
+import logging
+import warnings
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .foreca import whiten_array, full_rank_columns, foreca_numpy
+from .forecast import arima_batch, MIN_FIXED_HISTORY
+from .metrics import Metrics, timed
+from .alerts import make_alert
+
+logger = logging.getLogger(__name__)
+
+# define the hyperparamters
+N_COMP = 6 # how many ForeCA components
+W_WIDTH = 60 # rolling window prediction width
+COMP_THRESHOLD = 2 # how many comp think this is an anomaly for it to be an anomaly
+KEY_FEATURES = ['num_trials','total_profit','hits','BotCin','MidCin','BotLin','BotRin'] # features whose % change confirms an anomaly
+
+# columns of the session table that are not behavioural features, preprocess drops them
+META_COLUMNS = ['sessid','rigid','subjid','protocol',
+                'sessiondate', 'rig_starttime', 'start_time', 
+                'startstage','end_time', 'end_stage', 
+                'bias', 'stage', 'species',
+                'expgroup','settings_name']
+
+# define the RigAlarm class
+# since I can't give you access to our database, do not use the get_sessdata function
+
+# columns that define the cohort of a subject (see CohortModel)
+COHORT_COLUMNS = ['protocol', 'expgroup']
+
+def cohort_key(sess_df):
+  # the cohort of a subject: its last protocol / expgroup (the columns that are there)
+  return tuple(sess_df[col].iloc[-1] for col in COHORT_COLUMNS if col in sess_df.columns)
+
+class RigAlarm: 
+    def __init__(self, subjid, n_comp = N_COMP, w_width = W_WIDTH, 
+                 rolling = True, comp_threshold = 2, pred_index = -1, 
+                 n_steps = 3, pct_change_threshold = 60, 
+                 key_features = KEY_FEATURES,
+                 backend = 'r', model_store = None, refit_days = 30, refit_sessions = 30, 
+                 drift_threshold = 1.0, drift_min_sessions = 5, forecaster = 'batch', metrics = None,
+                 horizon = 1, rank_tol = 1e-5, alerts = None, result_log = None, cohort = None,
+                 spectrum_method = 'welch'): 
+      self.subjid = subjid
+      self.n_comp = n_comp # how many components to use in ForeCA
+      self.w_width = w_width # window width when applying ARIMA
+      self.rolling = True # rolling or expanding window prediction
+      self.comp_threshold = comp_threshold # report anomaly only when >= comp_threshold think it is one 
+      self.pred_index = pred_index # -1 means predict the last session, e.g. -3 means predict the third last session
+      self.horizon = horizon # how many sessions from pred_index on are forecast from a single fit and checked together
+                             # e.g. pred_index = -3 and horizon = 3 checks the last three sessions (catching up after a weekend)
+      self.is_anomaly = False # default
+      self.n_steps = n_steps # p term for ARIMA and n_steps for LSTM 
+      self.forecaster = forecaster # 'batch' uses arima_batch on all the components, 'statsmodels' fits one ARIMA per component
+      self.backend = backend # 'r' uses the R ForeCA package through rpy2, 'numpy' uses the native version in foreca.py
+      self.rank_tol = rank_tol # features that add less than this (relative) to the span of the others are dropped before ForeCA
+      self.spectrum_method = spectrum_method # spectrum estimate of the numpy backend, 'mvspec' is the one R ForeCA uses (see mvspectrum)
+
+      # cached ForeCA model, refit only when it is older than refit_days, has seen refit_sessions new sessions,
+      # or the mean of the new sessions moved by more than drift_threshold standard deviations on any feature
+      # (only checked once there are drift_min_sessions new sessions, so a single odd session does not trigger it)
+      self.model_store = model_store # a ForeCAModelStore, None means refit every time
+      self.refit_days = refit_days
+      self.refit_sessions = refit_sessions
+      self.drift_threshold = drift_threshold
+      self.drift_min_sessions = drift_min_sessions
+
+      # stage timings, ARIMA convergence, dropped rows / columns are recorded as events here
+      self.metrics = Metrics() if metrics is None else metrics
+      self.alerts = alerts # an AlertDispatcher, run() submits its decisions to it
+      self.result_log = result_log # a ResultLog, run() appends its results (result_) to it
+      # a CohortModel (or a dict of them by cohort key, see fit_cohorts): its shared ForeCA model is used instead 
+      # of fitting one, and its forecaster covers histories shorter than w_width and warm-starts the ARIMA
+      self.cohort = cohort
+
+      # these two things can be adjusted according to experimenter needs 
+      self.pct_change_threshold = pct_change_threshold # the pct change threshold of the key features to be qualified as an anomaly
+      self.key_features = key_features # a list of protocol-relevant features used in the final step of anomaly evaluation
+
+    def split_sequences(self, sequences, n_steps):
+      # split multivariate time series into chunked sequences
+      X, y = list(), list()
+      for i in range(len(sequences)):
+        # find the end of this pattern
+        end_ix = i + n_steps
+        # check if we are beyond the dataset
+        if end_ix >= len(sequences):
+          break
+        # gather input and output parts of the pattern
+        seq_x, seq_y = sequences[i:end_ix, :], sequences[end_ix, :]
+        X.append(seq_x)
+        y.append(seq_y)
+      return np.array(X), np.array(y)
+    
+    #def get_dbe(self):
+    #  # secret codes 
+    #  dbe = 'secret connection'
+    #  return(dbe)
+
+    #def get_sessdata(self): 
+    #  # prepare session date given the subjid, can only be used with dbe
+    #  dbe = self.get_dbe()
+    # sqlstr = 'select * from beh.sessview where subjid = {} order by sessiondate'.format(self.subjid)
+    #  sessview_df = pd.read_sql(sqlstr,dbe) 
+    #  sqlstr = 'select sessid, TopLin, TopRin, MidLin, MidCin, MidRin, BotLin, BotCin, BotRin from testing.sesspokes where subjid = {}'.format(self.subjid)
+    #  pokes_df = pd.read_sql(sqlstr,dbe) 
+    #  sess_df = pd.merge(sessview_df, pokes_df, on = 'sessid').sort_values(by='sessiondate').reset_index(drop=True)
+    #  return sess_df
+  
+    @timed('preprocess')
+    def preprocess(self, sess_df):
+      # preprocess sess_df to be foreCA ready
+      # sess_df = self.get_sessdata()
+
+      # drop the unwanted columns (the session store only keeps some of them)
+      clean_df = sess_df.drop(columns = [col for col in META_COLUMNS if col in sess_df.columns], axis = 1)
+      
+      # handle the missing values
+      clean_df['mass'] = clean_df['mass'].fillna(method = 'ffill')
+      clean_df['mass'] = clean_df['mass'].fillna(value = clean_df['mass'].mean())
+      n_rows = clean_df.shape[0]
+      clean_df = clean_df[clean_df['total_profit'].notna()]
+      self.metrics.emit('rows_dropped', subjid = self.subjid, reason = 'total_profit_na', count = n_rows - clean_df.shape[0])
+      n_rows = clean_df.shape[0]
+      clean_df = clean_df[clean_df['sess_min']>50]
+      self.metrics.emit('rows_dropped', subjid = self.subjid, reason = 'sess_min', count = n_rows - clean_df.shape[0])
+      clean_df = clean_df.fillna(value = 0) # replace all the NAs in pokes with 0
+      clean_array = clean_df.to_numpy().astype('float32')
+      self.clean_df = clean_df
+      self.cohort_key_ = cohort_key(sess_df)
+      return clean_array
+
+    @timed('foreCA')
+    def foreCA(self, clean_array):
+      # apply foreCA on the preprocessed data
+      # first drop the features that make the matrix rank deficient (e.g. pokes that are always 0), in one pass
+      # the projection still takes all the features (0 weight for the dropped ones), so project() works on 
+      # new sessions as they come, dropped_features_ keeps their names
+      n_features = clean_array.shape[1]
+      self.kept_columns_ = full_rank_columns(clean_array, self.rank_tol)
+      self.dropped_features_ = [name for i, name in enumerate(self.clean_df.columns) if i not in self.kept_columns_]
+      if self.dropped_features_:
+        self.metrics.emit('columns_dropped', subjid = self.subjid, columns = self.dropped_features_)
+        logger.warning('Subject %s: the feature matrix was not full rank, %s were discarded.', self.subjid, self.dropped_features_)
+      full_array, clean_array = clean_array, clean_array[:, self.kept_columns_]
+
+      # apply foreCA on the whitened data
+      if self.backend == 'r':
+        from .r_backend import r_foreca
+        model = r_foreca(clean_array, self.n_comp)
+        self.foreca_scores_ = np.array(model.rx2('scores'))
+        self.foreca_loadings_ = np.array(model.rx2('loadings'))
+        self.foreca_omegas_ = np.array(model.rx2('Omega'))
+        self.foreca_order_ = np.arange(self.foreca_scores_.shape[1]) # the order the components were found in is not returned
+        # the whitening is not returned in a usable form, so recover the linear map from the data to the scores
+        self.foreca_center_ = clean_array.mean(axis = 0).astype('float64')
+        self.foreca_projection_ = np.linalg.lstsq(clean_array - self.foreca_center_, self.foreca_scores_, rcond = None)[0]
+      elif self.backend == 'numpy':
+        whitened_array, self.foreca_center_, whitening = whiten_array(clean_array)
+        self.foreca_scores_, self.foreca_loadings_, self.foreca_omegas_, self.foreca_order_ = foreca_numpy(
+            whitened_array, self.n_comp, spectrum_method = self.spectrum_method, return_order = True)
+        self.foreca_projection_ = whitening @ self.foreca_loadings_
+      else:
+        raise ValueError('Unknown ForeCA backend {}'.format(self.backend))
+      if len(self.kept_columns_) < n_features: # back to all the features
+        center = full_array.mean(axis = 0).astype('float64')
+        center[self.kept_columns_] = self.foreca_center_
+        projection = np.zeros((n_features, self.foreca_projection_.shape[1]))
+        projection[self.kept_columns_] = self.foreca_projection_
+        self.foreca_center_, self.foreca_projection_ = center, projection
+      return
+
+    def cohort_model(self):
+      # the CohortModel of this subject, or None
+      # with a dict (fit_cohorts) the subject's cohort key, or the widest prefix of it there is a model for
+      if not isinstance(self.cohort, dict):
+        return self.cohort
+      key = getattr(self, 'cohort_key_', None)
+      if key is None:
+        return None
+      for depth in range(len(key), -1, -1):
+        if key[:depth] in self.cohort:
+          return self.cohort[key[:depth]]
+      return None
+
+    def project(self, clean_array):
+      # scores of new sessions under the current ForeCA model, a single matrix product
+      return (clean_array - self.foreca_center_) @ self.foreca_projection_
+
+    def needs_refit(self, model, meta, clean_array, sessids):
+      # decide if the cached model can still be used for these sessions
+      n_cached = len(model['sessids'])
+      if meta['n_comp'] != self.n_comp or meta['backend'] != self.backend or meta['n_features'] != clean_array.shape[1]:
+        return 'settings changed'
+      if n_cached > len(sessids) or not np.array_equal(model['sessids'], sessids[:n_cached]):
+        return 'history changed'
+      fitted_at = datetime.datetime.fromisoformat(meta['fitted_at'])
+      if datetime.datetime.now() - fitted_at > timedelta(days = self.refit_days):
+        return 'model too old'
+      n_fit = meta['n_fit_sessions']
+      if len(sessids) - n_fit >= self.refit_sessions:
+        return 'too many new sessions'
+      if len(sessids) - n_fit >= self.drift_min_sessions:
+        # standardised shift of the mean of everything seen since the fit
+        shift = np.abs(clean_array[n_fit:].mean(axis = 0) - model['feature_mean']) / model['feature_std']
+        if np.max(shift) > self.drift_threshold:
+          return 'feature drift'
+      return None
+
+    @timed('fit_or_project')
+    def fit_or_project(self, clean_array, sessids):
+      # use the cached model in model_store and only project the sessions it has not seen yet
+      # otherwise fit ForeCA from scratch and cache the result
+      sessids = np.asarray(sessids)
+      cohort = self.cohort_model()
+      if cohort is not None: # the shared model of the cohort, nothing to fit
+        cohort.apply(self, clean_array)
+        return
+      if self.cohort is not None: # no model for this subject's cohort, it needs enough sessions of its own
+        self.metrics.emit('cohort_missing', subjid = self.subjid, cohort = getattr(self, 'cohort_key_', None))
+        logger.warning('Subject %s: no cohort model for %s, fitting its own ForeCA.', self.subjid, getattr(self, 'cohort_key_', None))
+        if clean_array.shape[0] < self.w_width:
+          raise ValueError('Subject {} has no cohort model for {} and only {} sessions, {} are needed to fit its own'.format(
+              self.subjid, getattr(self, 'cohort_key_', None), clean_array.shape[0], self.w_width))
+      if self.model_store is None:
+        self.foreCA(clean_array)
+        return
+      model, meta = self.model_store.load(self.subjid)
+      self.refit_reason = 'no cached model' if model is None else self.needs_refit(model, meta, clean_array, sessids)
+      if self.refit_reason is None: 
+        self.foreca_center_ = model['center']
+        self.foreca_projection_ = model['projection']
+        self.foreca_loadings_ = model['loadings']
+        self.foreca_omegas_ = model['omegas']
+        self.dropped_features_ = meta.get('dropped_features', [])
+        n_cached = len(model['sessids'])
+        self.foreca_scores_ = np.concatenate([model['scores'], self.project(clean_array[n_cached:])])
+        if n_cached == len(sessids): # nothing new, no need to touch the disk
+          return
+      else: 
+        self.foreCA(clean_array)
+        meta = {'fitted_at': datetime.datetime.now().isoformat(), 'n_fit_sessions': len(sessids), 
+                'n_comp': self.n_comp, 'backend': self.backend, 'n_features': clean_array.shape[1],
+                'feature_names': list(self.clean_df.columns), 'dropped_features': self.dropped_features_,
+                'refit_reason': self.refit_reason}
+        model = {'center': self.foreca_center_, 'projection': self.foreca_projection_,
+                 'loadings': self.foreca_loadings_, 'omegas': self.foreca_omegas_, 
+                 'feature_mean': clean_array.mean(axis = 0), 
+                 'feature_std': clean_array.std(axis = 0) + 1e-8} # avoid dividing by 0 for constant features
+      model['scores'] = self.foreca_scores_
+      model['sessids'] = sessids
+      meta['last_sessid'] = int(sessids[-1])
+      self.model_store.save(self.subjid, model, meta)
+      return
+
+    @timed('arima_predict')
+    def arima_predict(self, warm_start = None):
+      # use ARIMA to predict the next value for each foreCA component 
+      # the default of pred_index is -1: predict the last value
+      # it can also be set to e.g. -3, predict the third last value
+      # warm_start: per-component ARIMA parameters (e.g. the previous window's arima_params_) to start the MLE from
+      # with horizon > 1, y_true_, y_pred_, y_low_ and y_high_ are horizon x n_comp, one row per session
+      if self.pred_index + self.horizon > 0:
+        raise ValueError('pred_index {} leaves fewer than {} sessions to forecast'.format(self.pred_index, self.horizon))
+      y_pred = np.zeros((self.horizon, self.n_comp))
+      y_low = np.zeros((self.horizon, self.n_comp))
+      y_high = np.zeros((self.horizon, self.n_comp)) 
+      self.converged_ = np.zeros(self.n_comp, dtype = bool) # which components got a usable ARIMA fit
+      if self.horizon == 1:
+        self.y_true_ = self.foreca_scores_[self.pred_index,:]
+      else:
+        self.y_true_ = self.foreca_scores_[self.pred_index:self.pred_index + self.horizon or None,:]
+
+      if self.rolling == True: # if doing rolling window prediction
+        training_scores = self.foreca_scores_[self.pred_index - self.w_width : self.pred_index, :] # leave out today's score
+      else: # if doing expanding window prediction
+        training_scores = self.foreca_scores_[:self.pred_index, :]
+
+      iterations = np.zeros(self.n_comp, dtype = int)
+      errors = [None] * self.n_comp
+      cohort = self.cohort_model()
+      if cohort is not None and warm_start is None:
+        warm_start = cohort.warm_start(self.n_comp)
+      if cohort is not None and training_scores.shape[0] < self.w_width: # too short to fit, use the cohort's parameters
+        y_pred, y_low, y_high, self.converged_, self.arima_params_ = cohort.forecast(
+            training_scores[:, :self.n_comp], horizon = self.horizon)
+        y_pred, y_low, y_high = [a.reshape(self.horizon, self.n_comp) for a in (y_pred, y_low, y_high)]
+      elif self.forecaster == 'batch': # all components in one go
+        y_pred, y_low, y_high, self.converged_, self.arima_params_ = arima_batch(
+            training_scores[:, :self.n_comp], self.n_steps, horizon = self.horizon)
+        y_pred, y_low, y_high = [a.reshape(self.horizon, self.n_comp) for a in (y_pred, y_low, y_high)]
+        iterations[:] = 1 # closed form
+      elif self.forecaster == 'statsmodels':
+        from statsmodels.tsa.arima.model import ARIMA
+        self.arima_params_ = [None] * self.n_comp
+        # loop over each foreCA component 
+        for comp in range(self.n_comp): 
+          # apply ARIMA(n_steps,1,1) with drift, the parameters are drift, ar terms, ma term, sigma2
+          try:
+            arima = ARIMA(training_scores[:, comp], order = (self.n_steps,1,1), trend = 't')
+            with warnings.catch_warnings(): # the convergence warnings of every window, the outcome is in the metrics
+              warnings.simplefilter('ignore')
+              arima_fit = arima.fit(start_params = None if warm_start is None else warm_start[comp])
+            forecast = arima_fit.get_forecast(steps = self.horizon)
+            y_pred[:, comp] = forecast.predicted_mean
+            y_conf = forecast.conf_int(alpha = 0.1)
+            y_low[:, comp] = y_conf[:, 0]
+            y_high[:, comp] = y_conf[:, 1]
+            retvals = arima_fit.mle_retvals or {}
+            self.converged_[comp] = retvals.get('converged', True)
+            self.arima_params_[comp] = arima_fit.params
+            iterations[comp] = retvals.get('iterations', retvals.get('fcalls', 0))
+          except Exception as e: # when ARIMA failed to converge for some reason, recorded in the metrics
+            errors[comp] = '{}: {}'.format(type(e).__name__, e)
+      else:
+        raise ValueError('Unknown forecaster {}'.format(self.forecaster))
+      
+      if self.horizon == 1: # a single session keeps the plain n_comp vectors
+        y_pred, y_low, y_high = y_pred[0], y_low[0], y_high[0]
+      self.y_pred_, self.y_low_, self.y_high_ = y_pred, y_low, y_high
+
+      # just in case, remove NAs in the prediction
+      self.converged_ = self.converged_ & np.all(np.isfinite(y_pred.reshape(-1, self.n_comp)), axis = 0)
+      for comp in range(self.n_comp):
+        self.metrics.emit('arima_component', subjid = self.subjid, pred_index = self.pred_index, comp = comp + 1, 
+                          forecaster = self.forecaster, converged = bool(self.converged_[comp]), 
+                          iterations = int(iterations[comp]), error = errors[comp])
+      self.y_pred_[np.isnan(self.y_pred_)] = 0
+      self.y_low_[np.isnan(self.y_low_)] = 0
+      self.y_high_[np.isnan(self.y_high_)] = 0
+      pass
+    
+    def walk_forward(self, method = 'arima', chunk_size = 64):
+      # walk-forward backtest over the foreCA scores, oldest window first
+      # yields (pred_index, y_true, y_pred, y_low, y_high, converged) for every session that has a full w_width window before it
+      # - batch forecaster + rolling window: the windows are zero-copy strided views, stacked chunk_size at a time
+      #   as extra columns of a single arima_batch call
+      # - statsmodels forecaster: every fit is warm-started from the previous window's parameters
+      # - method 'lstm': one LSTM per subject, trained further on the window before every chunk of sessions and with
+      #   all the Monte Carlo samples of a chunk in one forward pass (lstm_walk_forward)
+      #   'lstm_window' is the original LSTM per window (lstm_predict), slow
+      # - with a cohort model, the sessions before the first full window are forecast by the cohort forecaster first,
+      #   from the first one with MIN_FIXED_HISTORY sessions before it
+      n_sess = self.foreca_scores_.shape[0]
+      first = self.w_width - n_sess # pred_index of the first session with a full window
+      if method == 'arima' and self.cohort_model() is not None:
+        for pred_index in range(MIN_FIXED_HISTORY - n_sess, min(first, 0)):
+          self.pred_index = pred_index
+          self.arima_predict()
+          yield pred_index, self.y_true_, self.y_pred_, self.y_low_, self.y_high_, self.converged_
+      if method == 'arima' and self.forecaster == 'batch' and self.rolling == True:
+        if first >= 0: # no full window
+          return
+        scores = self.foreca_scores_[:, :self.n_comp]
+        windows = sliding_window_view(scores, self.w_width, axis = 0) # window x comp x time
+        for chunk_start in range(0, n_sess - self.w_width, chunk_size):
+          chunk = windows[chunk_start:min(chunk_start + chunk_size, n_sess - self.w_width)]
+          n_win = chunk.shape[0]
+          training_scores = chunk.reshape(n_win * self.n_comp, self.w_width).T # time x (window, comp)
+          y_pred, y_low, y_high, converged, _ = arima_batch(training_scores, self.n_steps)
+          y_pred, y_low, y_high, converged = [a.reshape(n_win, self.n_comp) for a in (y_pred, y_low, y_high, converged)]
+          converged = converged & np.isfinite(y_pred)
+          for k in range(n_win):
+            pred_index = first + chunk_start + k
+            yield (pred_index, scores[pred_index], np.nan_to_num(y_pred[k]), 
+                   np.nan_to_num(y_low[k]), np.nan_to_num(y_high[k]), converged[k])
+        return
+      if method == 'lstm':
+        from .lstm import lstm_walk_forward
+        y_true, y_pred, y_low, y_high, self.lstm_history = lstm_walk_forward(
+            self.foreca_scores_[:, :self.n_comp], self.w_width, self.n_steps)
+        converged = np.ones(self.n_comp, dtype = bool)
+        for k in range(y_true.shape[0]):
+          yield first + k, y_true[k], y_pred[k], y_low[k], y_high[k], converged
+        return
+      
+      warm_start = None
+      for pred_index in range(first, 0):
+        self.pred_index = pred_index
+        if method == 'arima':
+          self.arima_predict(warm_start = warm_start)
+          if self.forecaster == 'statsmodels': # failed components start cold next time
+            warm_start = self.arima_params_
+          yield pred_index, self.y_true_, self.y_pred_, self.y_low_, self.y_high_, self.converged_
+        elif method == 'lstm_window':
+          self.lstm_predict()
+          yield (pred_index, self.y_true_, self.lstm_pred_[0], self.lstm_y_low_[0], self.lstm_y_high_[0], 
+                 np.ones(self.n_comp, dtype = bool))
+        else:
+          raise ValueError('Unknown method {}'.format(method))
+
+    def lstm_predict(self):
+      # use LSTM to predict the next value for all the foreCA components
+      # this is not used in the main solution, it is rather for comparison and plotting
+      from .lstm import build_lstm
+      lstm = build_lstm(self.n_steps, self.n_comp)
+
+      # prepare training set
+      if self.rolling == True: 
+        training_scores = self.foreca_scores_[self.pred_index - self.w_width : self.pred_index, :]
+      else: 
+        training_scores = self.foreca_scores_[:self.pred_index, :] 
+
+      # split a multivariate sequence into samples
+      X, y = self.split_sequences(training_scores, self.n_steps)
+
+      # train LSTM
+      self.lstm_history = lstm.fit(X, y, epochs = 50, batch_size = 64, verbose = 0, shuffle = False)
+
+      # prepare test set 
+      X_test = training_scores[-self.n_steps:,:]
+      X_test = np.reshape(X_test, (1, self.n_steps, self.n_comp))
+
+      # Get LSTM confidence interval using Monte Carlo sampling methods
+      mc_pred = []
+      mc_times = 50 # how many times of sampling?
+      for i in range(mc_times):
+        out = lstm.predict(X_test)
+        mc_pred.append(out)
+      mc_pred = np.array(mc_pred)
+
+      mean_pred = np.array(mc_pred).mean(axis = 0)
+      conf_high = mean_pred + 1.645 * (np.array(mc_pred).std(axis = 0) / np.sqrt(mc_times)) # 90% confidence interval
+      conf_low = mean_pred - 1.645 * (np.array(mc_pred).std(axis = 0) / np.sqrt(mc_times)) # 90% confidence interval
+
+      # store the prediction results 
+      self.y_true_ = self.foreca_scores_[self.pred_index,:]
+      self.lstm_pred_ = mean_pred
+      self.lstm_y_low_ = conf_low
+      self.lstm_y_high_ = conf_high
+      return
+
+    @timed('detect_outliers')
+    def detect_outliers(self):   
+      # detect outliers based on ARIMA confidence intervals 
+      if self.horizon > 1: # several sessions from one fit, scored all at once
+        self.detect_outliers_horizon()
+        return
+      self.outlier_comp = []
+      self.abs_conf_diff_ = []
+
+      # loop over each valid foreCA component to see where it lies with respect to ARIMA confidence interval
+      for comp in range(self.n_comp): 
+        if not self.converged_[comp]: # if this component is not converged, skip it 
+          continue
+        else:
+          if (self.y_true_[comp] < self.y_low_[comp]) or (self.y_true_[comp] > self.y_high_[comp]): # if is an outlier 
+            self.outlier_comp = np.append(self.outlier_comp, comp + 1)  
+            if (self.y_true_[comp] < self.y_low_[comp]): # if lower than conf
+              acd = np.abs(self.y_low_[comp] - self.y_true_[comp]) 
+            else: # if higher than conf
+              acd = np.abs(self.y_true_[comp] - self.y_high_[comp])
+            self.abs_conf_diff_ = np.append(self.abs_conf_diff_, acd)
+
+      # determine if this session is an anomaly 
+      if len(self.outlier_comp) > self.comp_threshold:
+        self.is_anomaly = True
+
+        # retrieve the original session data and compare it to the previous session
+        if self.pred_index == -1: # indexing issues
+          compare_df = self.clean_df.iloc[self.pred_index-1:]
+        else: 
+          compare_df = self.clean_df.iloc[self.pred_index-1:self.pred_index+1]
+        self.compare_df = compare_df
+
+        # quantify the change 
+        cols = ['num_trials','hits','viols','total_profit','mass',
+               'TopLin', 'TopRin', 'MidLin', 'MidCin', 'MidRin', 'BotLin', 'BotCin', 'BotRin']
+        diff_pct = np.divide((compare_df.iloc[1].loc[cols] - compare_df.iloc[0].loc[cols]), compare_df.iloc[0].loc[cols])
+        self.diff_df = pd.DataFrame(diff_pct * 100)
+
+        # if there is less than pct_change_threshold in the key features columns 
+        if np.max(np.abs(self.diff_df.loc[self.key_features]))[0] < self.pct_change_threshold:
+          self.is_anomaly = False # maybe the algorithm's criterion is not the same as yours 
+
+        return 
+
+    def detect_outliers_horizon(self):
+      # detect_outliers for the horizon sessions forecast by arima_predict, through the vectorized scoring
+      # horizon_anomaly_ holds the status of every session, outlier_comp and abs_conf_diff_ one array per session
+      # is_anomaly is True if any of the sessions is an anomaly
+      from .scoring import score_rigalarm
+      pred_index = self.pred_index + np.arange(self.horizon)
+      converged = np.broadcast_to(self.converged_, self.y_true_.shape)
+      self.horizon_scores_ = score_rigalarm(self, pred_index, self.y_true_, self.y_low_, self.y_high_, converged)
+      outliers = self.horizon_scores_['outliers']
+      self.horizon_anomaly_ = self.horizon_scores_['is_anomaly']
+      self.outlier_comp = [np.where(row)[0] + 1 for row in outliers]
+      self.abs_conf_diff_ = [dist[row] for dist, row in zip(self.horizon_scores_['conf_dist'], outliers)]
+      self.is_anomaly = bool(np.any(self.horizon_anomaly_))
+
+    def session_results(self, sess_df):
+      # the scored sessions as SessionResults (one, or horizon of them), after detect_outliers
+      # max_pct_change is the largest |% change| of the key features from the session before, whatever the vote
+      from .results import SessionResult
+      from .scoring import pct_change, max_pct_change
+      clean_sessions = sess_df.loc[self.clean_df.index]
+      first = self.clean_df.shape[0] + self.pred_index
+      results = []
+      for k in range(self.horizon):
+        row = first + k
+        if self.horizon == 1:
+          y_true, y_pred, y_low, y_high = self.y_true_, self.y_pred_, self.y_low_, self.y_high_
+          is_anomaly, outlier_comp, abs_conf_diff = self.is_anomaly, self.outlier_comp, self.abs_conf_diff_
+          max_pct = max_pct_change(pct_change(self.clean_df.to_numpy(dtype = 'float64'), self.clean_df.columns, 
+                                              [row], self.key_features))[0]
+        else:
+          y_true, y_pred, y_low, y_high = self.y_true_[k], self.y_pred_[k], self.y_low_[k], self.y_high_[k]
+          is_anomaly, outlier_comp, abs_conf_diff = self.horizon_anomaly_[k], self.outlier_comp[k], self.abs_conf_diff_[k]
+          max_pct = self.horizon_scores_['max_pct_change'][k]
+        sessiondate = clean_sessions.sessiondate.iloc[row] if 'sessiondate' in clean_sessions.columns else None
+        results.append(SessionResult(self.subjid, int(clean_sessions.sessid.iloc[row]), sessiondate, row, 
+                                     bool(is_anomaly), np.asarray(outlier_comp, dtype = int), np.asarray(abs_conf_diff),
+                                     float(max_pct), y_true, y_pred, y_low, y_high, self.converged_))
+      return results
+
+    @timed('run')
+    def run(self, sess_df):
+      clean_array = self.preprocess(sess_df)
+      self.fit_or_project(clean_array, sess_df.loc[self.clean_df.index, 'sessid'].to_numpy())
+      self.arima_predict()
+      self.detect_outliers()
+      results = self.session_results(sess_df)
+      self.result_ = results[0] if self.horizon == 1 else results
+      if self.result_log is not None:
+        for result in results:
+          self.result_log.append(result)
+      # the scored sessions are counted among the clean ones, dropped sessions would shift the raw rows
+      sessiondates = sess_df.loc[self.clean_df.index, 'sessiondate']
+      rigids = sess_df.loc[self.clean_df.index, 'rigid'] if 'rigid' in sess_df.columns else None
+      if self.horizon > 1: # one line per forecast session
+        sessions = slice(self.pred_index, self.pred_index + self.horizon or None)
+        rigids = [None] * self.horizon if rigids is None else rigids.iloc[sessions]
+        for sessiondate, rigid, is_anomaly, outlier_comp, abs_conf_diff in zip(
+            sessiondates.iloc[sessions], rigids, self.horizon_anomaly_, self.outlier_comp, self.abs_conf_diff_):
+          self.metrics.emit('anomaly', subjid = self.subjid, sessiondate = sessiondate,
+                            is_anomaly = bool(is_anomaly), n_outlier_comp = len(outlier_comp))
+          if self.alerts is not None:
+            self.alerts.submit(make_alert(self.subjid, sessiondate, is_anomaly, outlier_comp, abs_conf_diff, rigid = rigid))
+          print("The anomaly status of subject {} on {} is {} with {} outlier components.".format(
+              self.subjid, sessiondate, is_anomaly, len(outlier_comp)))
+        return
+      sessiondate = sessiondates.iloc[self.pred_index]
+      self.metrics.emit('anomaly', subjid = self.subjid, sessiondate = sessiondate,
+                        is_anomaly = bool(self.is_anomaly), n_outlier_comp = len(self.outlier_comp))
+      if self.alerts is not None:
+        self.alerts.submit(make_alert(self.subjid, sessiondate, self.is_anomaly, 
+                                      self.outlier_comp, self.abs_conf_diff_, self.diff_df if self.is_anomaly else None, 
+                                      rigid = None if rigids is None else rigids.iloc[self.pred_index]))
+      print("The anomaly status of subject {} on {} is {} with {} outlier components.".format(
+          self.subjid, sessiondate, 
+          self.is_anomaly, len(self.outlier_comp)))
+      return
@@ -0,0 +1,121 @@
+import numpy as np
+
+# native ForeCA (numpy only), a drop-in replacement for the R ForeCA/whitening packages
+# it follows the same recipe: whiten the data, estimate the multivariate spectrum, 
+# then find the weight vectors that minimise the spectral entropy one at a time (EM algorithm)
+def whiten_array(x):
+  # center the data and apply the symmetric (ZCA) whitening matrix cov^(-1/2)
+  x = np.asarray(x, dtype = 'float64')
+  center = x.mean(axis = 0)
+  centered = x - center
+  values, vectors = np.linalg.eigh(np.cov(centered, rowvar = False))
+  whitening = (vectors / np.sqrt(values)) @ vectors.T
+  return centered @ whitening, center, whitening
+
+def full_rank_columns(x, tol = 1e-5):
+  # single-pass rank check before whitening: pivoted QR of the centered columns scaled to unit norm
+  # a column is kept if the part of it the columns picked before it cannot explain is above tol 
+  # (constant columns never are), returns the indices of the kept columns in their original order
+  from scipy.linalg import qr
+  x = np.asarray(x)
+  centered = x - x.mean(axis = 0)
+  norms = np.linalg.norm(centered, axis = 0)
+  norms[np.ptp(x, axis = 0) == 0] = np.inf # exactly constant, whatever the rounding of the mean
+  _, r, pivots = qr(centered / norms, mode = 'economic', pivoting = True)
+  diag = np.abs(np.diag(r))
+  return np.sort(pivots[:np.sum(diag > tol)])
+
+def mvspectrum(u, method = 'welch', nperseg = None, n_tapers = 5):
+  # estimate the multivariate spectrum of u (n_obs x n_series) for all series at once
+  # returns the real part of the spectral density matrices, one per frequency (DC excluded)
+  # the imaginary part does not matter because we only ever use w' f w with a real w
+  u = np.asarray(u, dtype = 'float64')
+  n_obs = u.shape[0]
+  if method == 'welch': # averaged periodograms of 50% overlapping hann-tapered segments
+    if nperseg is None:
+      nperseg = min(n_obs, max(16, n_obs // 4))
+    step = max(1, nperseg // 2)
+    starts = np.arange(0, n_obs - nperseg + 1, step)
+    segments = np.stack([u[s:s + nperseg] for s in starts]) # n_seg x nperseg x n_series
+    segments = segments - segments.mean(axis = 1, keepdims = True)
+    tapers = np.hanning(nperseg)[None, :]
+  elif method == 'mvspec': # raw periodogram of the whole series, R ForeCA's default (astsa::mvspec: no smoothing,
+    # no taper, linear trend removed)
+    trend = np.stack([np.ones(n_obs), np.arange(n_obs)], axis = 1)
+    segments = (u - trend @ np.linalg.lstsq(trend, u, rcond = None)[0])[None, :, :]
+    tapers = np.ones((1, n_obs))
+  elif method == 'multitaper': # average over orthogonal dpss tapers of the whole series
+    from scipy.signal import windows
+    segments = (u - u.mean(axis = 0))[None, :, :]
+    tapers = windows.dpss(n_obs, NW = (n_tapers + 1) / 2, Kmax = n_tapers)
+  else:
+    raise ValueError('Unknown spectrum method {}'.format(method))
+  # one FFT over every (taper, segment, series) combination
+  ffts = np.fft.rfft(tapers[:, None, :, None] * segments[None, :, :, :], axis = 2)[:, :, 1:, :]
+  spec = np.einsum('tsfi,tsfj->fij', ffts, ffts.conj()).real
+  spec = spec / np.trace(spec.sum(axis = 0)) * u.shape[1] # the spectrum sums to the covariance
+  return spec
+
+def spectral_omega(spec, weights, prior_weight = 1e-3):
+  # forecastability (in %) of the series u @ w for each column w of weights
+  # Omega = 1 - spectral entropy / max entropy, the prior keeps log() away from 0
+  dens = np.einsum('in,fij,jn->nf', weights, spec, weights)
+  dens = np.clip(dens, 0, None)
+  n_freq = spec.shape[0]
+  dens = (1 - prior_weight) * dens / dens.sum(axis = 1, keepdims = True) + prior_weight / n_freq
+  entropy = -np.sum(dens * np.log(dens), axis = 1)
+  return (1 - entropy / np.log(n_freq)) * 100, dens
+
+def foreca_em(spec, n_init = 10, max_iter = 100, tol = 1e-6, seed = 0):
+  # find the single most forecastable weight vector for the spectrum 
+  # all random starts are iterated together as one batch
+  n_series = spec.shape[1]
+  if n_series == 1:
+    return np.ones(1)
+  rng = np.random.RandomState(seed)
+  weights = rng.normal(size = (n_series, n_init))
+  weights = weights / np.linalg.norm(weights, axis = 0)
+  for _ in range(max_iter):
+    _, dens = spectral_omega(spec, weights)
+    # EM step: the new weights are the smallest eigenvectors of sum_f -log(p_f) * f_f
+    entropy_mats = np.einsum('nf,fij->nij', -np.log(dens), spec)
+    _, vectors = np.linalg.eigh(entropy_mats)
+    new_weights = vectors[:, :, 0].T
+    new_weights = new_weights * np.sign(np.sum(new_weights * weights, axis = 0)) # keep the sign stable
+    delta = np.max(1 - np.abs(np.sum(new_weights * weights, axis = 0)))
+    weights = new_weights
+    if delta < tol:
+      break
+  omegas, _ = spectral_omega(spec, weights)
+  return weights[:, np.argmax(omegas)]
+
+def foreca_loadings(spec, n_comp, n_init = 10, seed = 0):
+  # the ForeCA loadings for a (whitened) multivariate spectrum, components are found one after another
+  # in the orthogonal complement of the ones we already have (uncorrelated scores)
+  # returns the loadings and Omegas sorted by forecastability, and the step at which each was found
+  n_series = spec.shape[1]
+  loadings = np.zeros((n_series, n_comp))
+  for comp in range(n_comp):
+    if comp == 0:
+      basis = np.eye(n_series)
+    else: # orthonormal basis of the complement of the previous loadings
+      q, _ = np.linalg.qr(loadings[:, :comp], mode = 'complete')
+      basis = q[:, comp:]
+    reduced_spec = np.einsum('ia,fij,jb->fab', basis, spec, basis)
+    loadings[:, comp] = basis @ foreca_em(reduced_spec, n_init = n_init, seed = seed + comp)
+  # the deflation is greedy, so sort by forecastability and fix the signs for reproducibility
+  omegas, _ = spectral_omega(spec, loadings)
+  order = np.argsort(-omegas)
+  loadings, omegas = loadings[:, order], omegas[order]
+  signs = np.sign(loadings[np.argmax(np.abs(loadings), axis = 0), np.arange(n_comp)])
+  return loadings * signs, omegas, order
+
+def foreca_numpy(u, n_comp, spectrum_method = 'welch', n_init = 10, seed = 0, return_order = False):
+  # ForeCA on already whitened data u, see foreca_loadings
+  # the first k components found do not depend on n_comp, return_order = True also returns the step 
+  # at which each (sorted) component was found, so a fit with a smaller n_comp can be read off this one
+  spec = mvspectrum(u, method = spectrum_method)
+  loadings, omegas, order = foreca_loadings(spec, n_comp, n_init = n_init, seed = seed)
+  if return_order:
+    return u @ loadings, loadings, omegas, order
+  return u @ loadings, loadings, omegas
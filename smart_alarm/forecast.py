@@ -0,0 +1,105 @@
+from statistics import NormalDist
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+MIN_FIXED_HISTORY = 2 # arima_fixed needs one difference
+
+# batched ARIMA(p,1,1) with drift, fitted on all the foreCA components of a window at once
+# instead of a numerical MLE per component, this uses the closed-form Hannan-Rissanen estimator:
+# a long AR fit gives estimates of the innovations, then one least squares fit gives the AR and MA terms
+
+def lag_matrix(series, n_lags, start):
+  # design matrix [1, x(t-1), ..., x(t-n_lags)] for every t >= start, for all components at once
+  # series is n_obs x n_comp, the result is n_comp x (n_obs - start) x (n_lags + 1)
+  n_obs, n_comp = series.shape
+  lags = sliding_window_view(series, n_lags, axis = 0)[start - n_lags:n_obs - n_lags, :, ::-1] # t x comp x lag
+  ones = np.ones((n_obs - start, n_comp, 1))
+  return np.concatenate([ones, lags], axis = 2).transpose(1, 0, 2)
+
+def batch_lstsq(x, y, ridge = 1e-8):
+  # least squares for a stack of problems, x is batch x n x k and y is batch x n
+  xtx = np.einsum('bnk,bnl->bkl', x, x) + ridge * np.eye(x.shape[2])
+  xty = np.einsum('bnk,bn->bk', x, y)
+  return np.linalg.solve(xtx, xty[:, :, None])[:, :, 0]
+
+def arima_forecast(scores, diffs, const, ar, ma, sigma, last_innov, horizon = 1, alpha = 0.1):
+  # forecast horizon steps of ARIMA(p,1,1) models with drift from their parameters, all components at once
+  # returns the forecasts (horizon x comp) and the half widths of the (1 - alpha) intervals
+  n_comp, n_steps = ar.shape
+  # forecast the differences recursively (the MA term only enters the first step), then integrate back
+  lags = diffs[::-1][:n_steps].T # comp x lag, most recent first
+  diff_pred = np.zeros((horizon, n_comp))
+  for h in range(horizon):
+    diff_pred[h] = const + np.sum(ar * lags, axis = 1) + (ma * last_innov if h == 0 else 0)
+    lags = np.concatenate([diff_pred[h][:, None], lags[:, :-1]], axis = 1)
+  y_pred = scores[-1] + np.cumsum(diff_pred, axis = 0)
+
+  # forecast error variance from the psi weights of the integrated model (1 - ar(B))(1 - B) y = (1 + ma B) e
+  ar_full = np.zeros((n_comp, n_steps + 1))
+  ar_full[:, :n_steps] += ar
+  ar_full[:, 0] += 1
+  ar_full[:, 1:] -= ar
+  psi = np.zeros((horizon, n_comp))
+  psi[0] = 1
+  for j in range(1, horizon):
+    psi[j] = (ma if j == 1 else 0) + sum(ar_full[:, i - 1] * psi[j - i] for i in range(1, min(j, n_steps + 1) + 1))
+  half_width = NormalDist().inv_cdf(1 - alpha / 2) * sigma * np.sqrt(np.cumsum(psi ** 2, axis = 0))
+  return y_pred, half_width
+
+def arima_batch(training_scores, n_steps, alpha = 0.1, n_long = None, horizon = 1):
+  # fit ARIMA(n_steps,1,1) with drift to each column of training_scores and forecast the next value
+  # (or the next horizon values, then the forecasts are horizon x comp arrays)
+  # returns the prediction, the (1 - alpha) interval, the per-component convergence flags and the parameters
+  scores = np.asarray(training_scores, dtype = 'float64')
+  diffs = np.diff(scores, axis = 0)
+  n_obs, n_comp = diffs.shape
+  if n_long is None: # order of the long AR used to estimate the innovations
+    n_long = max(n_steps + 1, min(10, n_obs // 4))
+
+  # stage 1: long AR, its residuals estimate the innovations
+  x_long = lag_matrix(diffs, n_long, n_long)
+  beta_long = batch_lstsq(x_long, diffs[n_long:].T)
+  innov = np.zeros((n_obs, n_comp))
+  innov[n_long:] = (diffs[n_long:].T - np.einsum('bnk,bk->bn', x_long, beta_long)).T
+
+  # stage 2: regress on the AR lags and the lagged innovation
+  start = max(n_steps, n_long + 1)
+  x = np.concatenate([lag_matrix(diffs, n_steps, start), innov[start - 1:-1].T[:, :, None]], axis = 2)
+  beta = batch_lstsq(x, diffs[start:].T)
+  resid = diffs[start:].T - np.einsum('bnk,bk->bn', x, beta)
+  dof = max(resid.shape[1] - beta.shape[1], 1)
+  sigma = np.sqrt(np.sum(resid ** 2, axis = 1) / dof)
+
+  const, ar, ma = beta[:, 0], beta[:, 1:n_steps + 1], beta[:, -1]
+  y_pred, half_width = arima_forecast(scores, diffs, const, ar, ma, sigma, resid[:, -1], horizon, alpha)
+  
+  # a component counts as converged if the fit is finite, stationary and invertible
+  companion = np.zeros((n_comp, n_steps, n_steps))
+  companion[:, 0, :] = ar
+  companion[:, np.arange(1, n_steps), np.arange(n_steps - 1)] = 1
+  stationary = np.max(np.abs(np.linalg.eigvals(companion)), axis = 1) < 1
+  converged = np.all(np.isfinite(y_pred), axis = 0) & (sigma > 0) & stationary & (np.abs(ma) < 1)
+  params = {'const': const, 'ar': ar, 'ma': ma, 'sigma': sigma}
+  if horizon == 1:
+    y_pred, half_width = y_pred[0], half_width[0]
+  return y_pred, y_pred - half_width, y_pred + half_width, converged, params
+
+def arima_fixed(training_scores, params, horizon = 1, alpha = 0.1):
+  # forecast with given parameters (e.g. a cohort's, see CohortModel) instead of fitting them, for series that 
+  # are too short to fit: from MIN_FIXED_HISTORY scores on, shorter ones are not converged. missing lags count 
+  # as 0 and the innovations are filtered from the differences there are. same returns as arima_batch
+  scores = np.asarray(training_scores, dtype = 'float64')
+  const, ar, ma, sigma = params['const'], params['ar'], params['ma'], params['sigma']
+  n_comp, n_steps = ar.shape
+  if scores.shape[0] < MIN_FIXED_HISTORY: # nothing to difference
+    y_pred = np.full((horizon, n_comp) if horizon > 1 else n_comp, np.nan)
+    return y_pred, y_pred.copy(), y_pred.copy(), np.zeros(n_comp, dtype = bool), params
+  diffs = np.concatenate([np.zeros((n_steps, n_comp)), np.diff(scores, axis = 0)])
+  innov = np.zeros(n_comp)
+  for t in range(n_steps, diffs.shape[0]):
+    innov = diffs[t] - const - np.sum(ar * diffs[t - n_steps:t][::-1].T, axis = 1) - ma * innov
+  y_pred, half_width = arima_forecast(scores, diffs, const, ar, ma, sigma, innov, horizon, alpha)
+  converged = np.all(np.isfinite(y_pred), axis = 0)
+  if horizon == 1:
+    y_pred, half_width = y_pred[0], half_width[0]
+  return y_pred, y_pred - half_width, y_pred + half_width, converged, params
@@ -0,0 +1,53 @@
+# keras is only imported when an LSTM is actually built, it takes seconds to load
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+def build_lstm(n_steps, n_comp):
+  # LSTM with dropout kept on at prediction time, so repeated predictions give Monte Carlo samples
+  from keras.models import Model, Input
+  from keras.layers import Dense, LSTM, Dropout
+  inp = Input(shape = (n_steps, n_comp)) #n_steps, n_features
+  x = LSTM(64, activation='relu')(inp)
+  x = Dropout(0.5)(x, training = True) # apply dropout to approximate confidence intervals
+  out = Dense(n_comp)(x)
+  lstm = Model(inputs = inp, outputs = out)
+  lstm.compile(loss = 'mae', optimizer = 'adam')
+  return lstm
+
+def lstm_chunks(n_sess, w_width, n_steps, refit_every):
+  # the (training samples, predicted samples) of every chunk of refit_every sessions after the first w_width,
+  # as slices of the (n_steps sessions -> next session) samples, sample j predicts session j + n_steps
+  # the model of a chunk is trained on the samples whose target is in the w_width sessions before the chunk,
+  # the rolling window of ARIMA, so every prediction is out of sample and the model follows the subject
+  for start in range(w_width, n_sess, refit_every):
+    stop = min(start + refit_every, n_sess)
+    yield slice(max(start - w_width - n_steps, 0), start - n_steps), slice(start - n_steps, stop - n_steps)
+
+def lstm_walk_forward(scores, w_width, n_steps, mc_times = 50, epochs = 50, batch_size = 64,
+                      refit_every = 10, refit_epochs = 10):
+  # LSTM comparator for a whole walk-forward backtest in one go
+  # the sessions after the first w_width are predicted refit_every at a time (see lstm_chunks): the model is
+  # trained for epochs on the first window, then trained further for refit_epochs on the window before each chunk
+  # the Monte Carlo dropout samples of a chunk come from one predict call on its tiled inputs
+  # returns y_true, mean prediction, 90% interval (low, high) for every session after the first w_width,
+  # and the training history of every chunk
+  scores = np.asarray(scores, dtype = 'float32')
+  n_sess, n_comp = scores.shape
+  X = sliding_window_view(scores, n_steps, axis = 0)[:-1].transpose(0, 2, 1) # sample x n_steps x comp
+  y = scores[n_steps:]
+
+  lstm = build_lstm(n_steps, n_comp)
+  mean_pred = np.zeros((max(n_sess - w_width, 0), n_comp), dtype = 'float32')
+  half_width = np.zeros_like(mean_pred)
+  history = []
+  for train, test in lstm_chunks(n_sess, w_width, n_steps, refit_every):
+    history.append(lstm.fit(X[train], y[train], epochs = refit_epochs if history else epochs,
+                            batch_size = batch_size, verbose = 0, shuffle = False))
+    # the n_steps sessions before each predicted session, mc_times copies of each
+    X_test = X[test]
+    n_test = X_test.shape[0]
+    mc_pred = lstm.predict(np.tile(X_test, (mc_times, 1, 1)), batch_size = 4096).reshape(mc_times, n_test, n_comp)
+    rows = slice(test.start + n_steps - w_width, test.stop + n_steps - w_width)
+    mean_pred[rows] = mc_pred.mean(axis = 0)
+    half_width[rows] = 1.645 * (mc_pred.std(axis = 0) / np.sqrt(mc_times)) # 90% confidence interval
+  return scores[w_width:], mean_pred, mean_pred - half_width, mean_pred + half_width, history
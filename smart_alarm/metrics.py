@@ -0,0 +1,98 @@
+# instrumentation: structured events for the stages of RigAlarm and the colony runner
+# every event is a flat dict (ts, event, subjid, ...), kept in a bounded buffer and optionally streamed as json lines;
+# running totals are updated as events come in, so the prometheus text is cheap to produce at any time
+import sys
+import json
+import time
+import functools
+from collections import deque, defaultdict
+
+class Metrics:
+    def __init__(self, stream = None, max_events = 10000):
+      self.stream = stream # file-like object, every event is written to it as a json line
+      self.events = deque(maxlen = max_events) # the most recent events
+      self.counters = defaultdict(float) # (metric name, sorted label items) -> value
+
+    def emit(self, event, **fields):
+      record = {'ts': time.time(), 'event': event}
+      record.update(fields)
+      self.events.append(record)
+      self.count(record)
+      if self.stream is not None:
+        self.stream.write(json.dumps(record, default = str) + '\n')
+      return record
+
+    def count(self, record):
+      # fold an event into the running totals
+      event = record['event']
+      if event == 'stage':
+        self.counters[('smart_alarm_stage_seconds_total', (('stage', record['stage']),))] += record['seconds']
+        self.counters[('smart_alarm_stage_calls_total', (('stage', record['stage']),))] += 1
+      elif event == 'arima_component':
+        labels = (('converged', str(bool(record['converged'])).lower()), ('forecaster', record['forecaster']))
+        self.counters[('smart_alarm_arima_components_total', labels)] += 1
+        self.counters[('smart_alarm_arima_iterations_total', (('forecaster', record['forecaster']),))] += record['iterations'] or 0
+      elif event == 'rows_dropped':
+        self.counters[('smart_alarm_rows_dropped_total', (('reason', record['reason']),))] += record['count']
+      elif event == 'columns_dropped':
+        self.counters[('smart_alarm_columns_dropped_total', ())] += len(record['columns'])
+      elif event == 'subject':
+        self.counters[('smart_alarm_subjects_total', (('status', 'error' if record['error'] else 'ok'),))] += 1
+      elif event == 'anomaly':
+        self.counters[('smart_alarm_anomalies_total', ())] += bool(record['is_anomaly'])
+      elif event == 'alert':
+        status = 'error' if record['status'].startswith('error') else record['status']
+        self.counters[('smart_alarm_alerts_total', (('sink', str(record['sink'])), ('status', status)))] += 1
+
+    def extend(self, events):
+      # merge events recorded elsewhere (e.g. in a worker process)
+      for record in events:
+        self.events.append(record)
+        self.count(record)
+        if self.stream is not None:
+          self.stream.write(json.dumps(record, default = str) + '\n')
+
+    def stage(self, name, **fields):
+      # context manager timing one stage
+      return StageTimer(self, name, fields)
+
+    def to_jsonl(self, path_or_file = sys.stdout):
+      if isinstance(path_or_file, str):
+        with open(path_or_file, 'a') as f:
+          return self.to_jsonl(f)
+      for record in self.events:
+        path_or_file.write(json.dumps(record, default = str) + '\n')
+
+    def to_prometheus(self):
+      # the running totals in the prometheus text exposition format
+      lines = []
+      for name in sorted(set(name for name, _ in self.counters)):
+        lines.append('# TYPE {} counter'.format(name))
+        for (metric, labels), value in sorted(self.counters.items()):
+          if metric == name:
+            label_text = ','.join('{}="{}"'.format(k, v) for k, v in labels)
+            lines.append('{}{} {}'.format(name, '{' + label_text + '}' if label_text else '', value))
+      return '\n'.join(lines) + '\n'
+
+class StageTimer:
+    def __init__(self, metrics, name, fields):
+      self.metrics, self.name, self.fields = metrics, name, fields
+
+    def __enter__(self):
+      self.start = time.perf_counter()
+      return self
+
+    def __exit__(self, exc_type, exc, tb):
+      self.metrics.emit('stage', stage = self.name, seconds = time.perf_counter() - self.start, 
+                        failed = exc_type is not None, **self.fields)
+      return False
+
+def timed(stage_name):
+  # decorator for RigAlarm methods: records the stage timing in self.metrics
+  def decorator(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+      with self.metrics.stage(stage_name, subjid = self.subjid):
+        return method(self, *args, **kwargs)
+    return wrapper
+  return decorator
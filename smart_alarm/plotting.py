@@ -0,0 +1,131 @@
+## PlOTTING FUNCTIONS
+# matplotlib, seaborn and sklearn are only loaded when this module is imported
+import numpy as np
+import matplotlib.pyplot as plt
+import seaborn as sns
+from sklearn.decomposition import PCA
+from sklearn.preprocessing import RobustScaler
+
+from .core import RigAlarm, N_COMP, W_WIDTH
+from .backtest import find_outliers, find_anomalies
+from .sessions import subject_sessions
+
+# define a customised plot format
+def label_plot(ax, xlabel_name, ylabel_name):
+  ax.tick_params(axis = 'both', which = 'major', labelsize = 40)
+  ax.set_xlabel(xlabel_name, fontdict = {'fontsize':50})
+  ax.set_ylabel(ylabel_name, fontdict = {'fontsize':50})
+  a = ax.get_yticks()
+  ax.set_yticks([a[0],a[-1]])
+  return ax
+
+# feature distribution plot
+def plot_feature_dist(df, subjid, feature):
+  sess_df = subject_sessions(df, subjid)
+  ra = RigAlarm(subjid)
+  ra.preprocess(sess_df)
+  clean_df = ra.clean_df
+  #fig = plt.figure(figsize=(15,7))
+  fig = sns.distplot(clean_df[feature])
+  ax = plt.gca()
+  label_plot(ax, feature," ")
+  return fig, ax
+
+# PCA / ForeCA plots
+def plot_dim_reducers(df, subjid, method = 'pca', which_comp = 0, **ra_kwargs):
+  ra = RigAlarm(subjid, **ra_kwargs)
+  sess_df = subject_sessions(df, subjid)
+  clean_array = ra.preprocess(sess_df)
+  clean_df = ra.clean_df
+  if method == 'pca':
+    cl = 'gray'
+    # first we normalise data using RobustScaler, it is robust to outliers
+    rbs = RobustScaler()
+    clean_scaled = rbs.fit_transform(clean_df)
+    # apply PCA
+    pca = PCA(n_components = N_COMP)
+    scores = pca.fit_transform(clean_scaled)
+    x_captured = pca.explained_variance_ratio_
+    # get relative loadings / feature importance
+    loadings = pca.components_.transpose()
+    relative_loadings = np.divide(loadings,np.std(loadings,axis = 0))
+  elif method == 'foreca':
+    # apply foreca using the function written in RigAlarm class
+    cl = 'dodgerblue'
+    ra.foreCA(clean_array)
+    x_captured= ra.foreca_omegas_
+    scores = ra.foreca_scores_
+    loadings = ra.foreca_loadings_
+    relative_loadings = np.divide(loadings,np.std(loadings,axis = 0))
+  
+  # variance / omega explained plot
+  fig1 = plt.figure(figsize = (15,7))
+  sns.barplot(list(range(1, N_COMP + 1)), x_captured, color = cl)
+  ax = plt.gca()
+  label_plot(ax, "PCA components",'% Var explained')
+
+  # component projection plot
+  fig2 = plt.figure(figsize = (15,7))
+  plt.plot(scores[:,which_comp], color = cl, linewidth = 5)
+  ax = plt.gca()
+  label_plot(ax, "sessions", "Component value")
+
+  # feature importance plot
+  fig3 = plt.figure(figsize = (15,7))
+  n_columns = clean_df.shape[1]
+  sns.barplot(list(range(n_columns)), relative_loadings[:,which_comp], color = cl)
+  plt.xticks(ticks = list(range(n_columns)), labels = clean_df.columns, fontsize = 20, rotation = 80)
+  ax = plt.gca()
+  label_plot(ax, " ","Feature importance")
+
+  # the main feature plot
+  fig4 = plt.figure(figsize = (15,7))
+  main_feature = clean_df.columns[np.argmax(np.abs(relative_loadings[:,0]))]
+  plt.plot(clean_df[main_feature], color = cl, linewidth = 5)
+  ax = plt.gca()
+  label_plot(ax, "sessions", main_feature)
+
+  return fig1, fig2, fig3, fig4 
+
+# plot rolling prediction results (from rolling_pred) and detected anomalies
+# x are the session numbers (by default the sessions after the first W_WIDTH), outliers (sessions x comps) and 
+# anomalies (sessions) are the decisions to mark, they are worked out from the intervals if not given
+def plot_rolling_pred(y_true, y_pred, conf_low, conf_high, which_comp = 0, plot_outlier = True, plot_anomaly = False,
+                      x = None, outliers = None, anomalies = None):
+  if x is None:
+    x = np.arange(W_WIDTH, y_true.shape[0] + W_WIDTH)
+  fig = plt.figure(figsize = (15, 7))
+  plt.plot(x, y_true[:,which_comp], color = 'gray', label='True')
+  plt.plot(x, y_pred[:,which_comp], color = 'salmon', label='Pred')
+  plt.fill_between(x, conf_low[:,which_comp], conf_high[:,which_comp], color = 'salmon', alpha =0.3, label = '90% Conf Interval')
+
+  # if we need to plot the outliers
+  if plot_outlier:
+    if outliers is None:
+      outliers_x, outliers_y = find_outliers(y_true, conf_low, conf_high, comp = which_comp)
+    else:
+      outliers_x = np.where(outliers[:, which_comp])[0]
+      outliers_y = y_true[outliers_x, which_comp]
+    plt.scatter(x[outliers_x], outliers_y, 
+              facecolor = (1, 1, 0, 0), edgecolors = 'dodgerblue', s = 70, linewidth = 2, label = 'Detected Outliers')
+  # if we need to plot the anomalies 
+  elif plot_anomaly:
+    anomalies_x = find_anomalies(y_true, conf_low, conf_high) if anomalies is None else np.where(anomalies)[0]
+    anomalies_y = y_true[anomalies_x, which_comp]
+    plt.scatter(x[anomalies_x], anomalies_y, 
+              facecolor = (1, 1, 0, 0), edgecolors = 'dodgerblue', s = 70, linewidth = 2, label = 'Detected Anomalies')
+    
+  plt.legend(fontsize = 20)
+  plt.title('Component {}'.format(which_comp + 1), fontdict = {'fontsize': 45})
+  ax = plt.gca()
+  label_plot(ax, "sessions", "Component value")
+  return fig, ax
+
+# the same for one subject of a ResultLog (filled by rolling_pred or RigAlarm.run)
+# the sessions are placed at their position in the subject's history and the marked anomalies are the 
+# logged decisions (so they include the key feature check)
+def plot_result_log(result_log, subjid, which_comp = 0, plot_outlier = True, plot_anomaly = False):
+  results = result_log.subject(subjid)
+  return plot_rolling_pred(results['y_true'], results['y_pred'], results['y_low'], results['y_high'], which_comp,
+                           plot_outlier, plot_anomaly, x = results['row'], outliers = results['outlier'], 
+                           anomalies = results['is_anomaly'])
@@ -0,0 +1,151 @@
+# incremental preprocessing: the same cleaning as RigAlarm.preprocess, but with the state it needs carried over
+# (the column order, the last valid mass, the running sum and count of the ffilled masses for their mean) so a new
+# session is cleaned in O(1) and appended to a cached float32 array instead of cleaning the whole history again
+# fit() + append() give exactly the array preprocess() returns on the whole history
+import math
+import numpy as np
+import pandas as pd
+
+from .core import META_COLUMNS
+from .metrics import Metrics
+
+# the columns the cleaning needs, the other features are only filled with 0 where they are missing
+REQUIRED_COLUMNS = ['mass', 'total_profit', 'sess_min']
+MIN_SESS_MIN = 50 # shorter sessions are dropped
+
+class Preprocessor:
+    def __init__(self, columns = None, subjid = None, metrics = None, capacity = 1024):
+      # columns: the feature columns in order, by default the non-meta columns of the first table given to fit
+      # every feature is read as float64 and the clean rows are float32, like preprocess
+      self.subjid = subjid
+      self.metrics = Metrics() if metrics is None else metrics
+      self.capacity = capacity
+      if columns is not None:
+        self.set_schema(columns)
+
+    def set_schema(self, columns):
+      missing = [col for col in REQUIRED_COLUMNS if col not in columns]
+      if missing:
+        raise ValueError('The session table has no {} column'.format(missing))
+      self.columns = list(columns)
+      self.dtypes = {col: np.dtype('float64') for col in self.columns}
+      self.i_mass, self.i_profit, self.i_sess_min = [self.columns.index(col) for col in REQUIRED_COLUMNS]
+      self.reset()
+
+    def reset(self):
+      self.data = np.zeros((self.capacity, len(self.columns)), dtype = 'float32') # the clean rows
+      self.size = 0
+      self.labels = [] # index label of every clean row
+      # the ffilled masses of the raw rows (nan before the first valid one) as a compensated running sum and a count
+      self.mass_sum, self.mass_comp, self.mass_count = 0.0, 0.0, 0
+      self.last_mass = np.nan
+      self.n_leading = 0 # clean rows before the first valid mass, a prefix of data filled with the mean mass
+
+    @property
+    def array(self):
+      # the clean rows so far, a view (what preprocess returns)
+      return self.data[:self.size]
+
+    def frame(self, start = None):
+      # the clean rows as a DataFrame (like RigAlarm.clean_df, but float32), from row start on
+      return pd.DataFrame(self.array[start:], index = self.labels[start:], columns = self.columns)
+
+    def raw_array(self, sess_df):
+      # the features of a session table in schema order as float64 (absent columns are missing values)
+      return np.stack([sess_df[col].to_numpy(dtype = self.dtypes[col], na_value = np.nan) if col in sess_df.columns
+                       else np.full(sess_df.shape[0], np.nan) for col in self.columns], axis = 1)
+
+    def raw_row(self, row):
+      # one session (a dict or a Series) as float64 in schema order
+      return np.array([np.nan if row.get(col) is None else self.dtypes[col].type(row.get(col)) for col in self.columns],
+                      dtype = 'float64')
+
+    def reserve(self, n_rows):
+      # double the buffer when it is full, so appends stay amortised O(1)
+      if self.size + n_rows > self.data.shape[0]:
+        data = np.zeros((max(2 * self.data.shape[0], self.size + n_rows), len(self.columns)), dtype = 'float32')
+        data[:self.size] = self.data[:self.size]
+        self.data = data
+
+    def add_mass(self, mass):
+      # Neumaier's compensated sum, so the running mean stays as accurate as a sum over the whole history
+      total = self.mass_sum + mass
+      if abs(self.mass_sum) >= abs(mass):
+        self.mass_comp += (self.mass_sum - total) + mass
+      else:
+        self.mass_comp += (mass - total) + self.mass_sum
+      self.mass_sum = total
+      self.mass_count += 1
+
+    def mean_mass(self):
+      # the fill value of the leading missing masses: the mean of the ffilled masses so far, in O(1)
+      # (only needed while there are leading rows). it can differ from the pandas mean of preprocess in the last
+      # bit of the float64, which the float32 clean rows round away
+      if not self.mass_count:
+        return 0.0
+      return (self.mass_sum + self.mass_comp) / self.mass_count
+
+    def fit(self, sess_df):
+      # clean a whole history at once (vectorised) and keep the state, returns the clean float32 array
+      if not hasattr(self, 'columns'):
+        self.set_schema([col for col in sess_df.columns if col not in META_COLUMNS])
+      else:
+        self.reset()
+      raw = self.raw_array(sess_df)
+      n_rows = raw.shape[0]
+      self.reserve(n_rows)
+
+      # forward fill the mass
+      mass = raw[:, self.i_mass]
+      last_valid = np.maximum.accumulate(np.where(np.isnan(mass), -1, np.arange(n_rows)))
+      masses = np.where(last_valid >= 0, mass[np.maximum(last_valid, 0)], np.nan)
+      valid_masses = masses[~np.isnan(masses)]
+      self.mass_sum, self.mass_comp, self.mass_count = math.fsum(valid_masses), 0.0, len(valid_masses)
+      if n_rows:
+        self.last_mass = masses[-1]
+
+      # the two filters
+      has_profit = ~np.isnan(raw[:, self.i_profit])
+      kept = has_profit & (raw[:, self.i_sess_min] > MIN_SESS_MIN)
+      self.metrics.emit('rows_dropped', subjid = self.subjid, reason = 'total_profit_na', count = int(np.sum(~has_profit)))
+      self.metrics.emit('rows_dropped', subjid = self.subjid, reason = 'sess_min', count = int(np.sum(has_profit & ~kept)))
+
+      clean = raw[kept]
+      clean[:, self.i_mass] = masses[kept]
+      self.n_leading = int(np.sum(np.isnan(masses[kept])))
+      if self.n_leading: # the pandas mean, as in preprocess
+        clean[:self.n_leading, self.i_mass] = pd.Series(masses).mean()
+      clean[np.isnan(clean)] = 0
+      self.size = clean.shape[0]
+      self.data[:self.size] = clean
+      self.labels = list(sess_df.index[kept])
+      return self.array
+
+    def append(self, row, label = None):
+      # clean one new session and append it, returns its float32 row (a view) or None if it is filtered out
+      # a new valid mass changes the mean, so the leading rows (if any) are filled again
+      values = self.raw_row(row)
+      if not np.isnan(values[self.i_mass]):
+        self.last_mass = values[self.i_mass]
+      self.reserve(1)
+      if not np.isnan(self.last_mass):
+        self.add_mass(self.last_mass)
+        if self.n_leading:
+          self.data[:self.n_leading, self.i_mass] = self.mean_mass()
+
+      if np.isnan(values[self.i_profit]):
+        self.metrics.emit('rows_dropped', subjid = self.subjid, reason = 'total_profit_na', count = 1)
+        return None
+      if not values[self.i_sess_min] > MIN_SESS_MIN:
+        self.metrics.emit('rows_dropped', subjid = self.subjid, reason = 'sess_min', count = 1)
+        return None
+      if np.isnan(self.last_mass): # no valid mass yet, this row is a leading one
+        values[self.i_mass] = self.mean_mass()
+        self.n_leading += 1
+      else:
+        values[self.i_mass] = self.last_mass
+      values[np.isnan(values)] = 0
+      self.data[self.size] = values
+      self.labels.append(label)
+      self.size += 1
+      return self.data[self.size - 1]
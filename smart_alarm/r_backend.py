@@ -0,0 +1,22 @@
+# the R side of the ForeCA backend, only loaded when RigAlarm(backend = 'r') is actually used
+# importing rpy2 starts R, and installing packages needs the network, so both happen on first use 
+# and the R packages are only installed if they are missing
+from rpy2.robjects.packages import importr, isinstalled
+from rpy2.robjects import pandas2ri
+pandas2ri.activate()
+
+R_PACKAGES = {}
+
+def r_package(name):
+  # importr with a cache, installing the package first if needed
+  if name not in R_PACKAGES:
+    if not isinstalled(name):
+      importr('utils').install_packages(name)
+    R_PACKAGES[name] = importr(name)
+  return R_PACKAGES[name]
+
+def r_foreca(clean_array, n_comp):
+  # whiten then apply foreCA, returns the R model
+  foreca = r_package('ForeCA')
+  whitened_array = foreca.whiten(clean_array)[5]
+  return foreca.foreca(whitened_array, n_comp = n_comp)
@@ -0,0 +1,136 @@
+# compact results: a SessionResult (__slots__ record) per scored session, and the ResultLog, an append-only
+# columnar log of preallocated structured numpy arrays (one row per session, grown by doubling)
+# the log can be flushed to disk in chunks and loaded back memory-mapped, so years of per-session results
+# are a few arrays instead of millions of small objects or DataFrames
+import os
+import glob
+import numpy as np
+
+from .core import N_COMP
+
+def result_dtype(n_comp = N_COMP):
+  # one row of the log, the per-component fields are (n_comp,) sub-arrays
+  return np.dtype([('subjid', 'i8'), ('sessid', 'i8'), ('sessiondate', 'M8[D]'), ('row', 'i8'),
+                   ('is_anomaly', '?'), ('n_outlier_comp', 'i4'), ('max_pct_change', 'f8'),
+                   ('y_true', 'f8', (n_comp,)), ('y_pred', 'f8', (n_comp,)), ('y_low', 'f8', (n_comp,)),
+                   ('y_high', 'f8', (n_comp,)), ('converged', '?', (n_comp,)), ('outlier', '?', (n_comp,)),
+                   ('conf_dist', 'f8', (n_comp,))])
+
+class SessionResult:
+    # the outcome of scoring one session (RigAlarm.result_), row is its position in the subject's clean sessions
+    # outlier_comp are 1-based component numbers and abs_conf_diff their distances to the interval, like detect_outliers
+    __slots__ = ['subjid', 'sessid', 'sessiondate', 'row', 'is_anomaly', 'outlier_comp', 'abs_conf_diff',
+                 'max_pct_change', 'y_true', 'y_pred', 'y_low', 'y_high', 'converged']
+
+    def __init__(self, subjid, sessid, sessiondate, row, is_anomaly, outlier_comp, abs_conf_diff,
+                 max_pct_change, y_true, y_pred, y_low, y_high, converged):
+      self.subjid = subjid
+      self.sessid = sessid
+      self.sessiondate = sessiondate
+      self.row = row
+      self.is_anomaly = is_anomaly
+      self.outlier_comp = outlier_comp
+      self.abs_conf_diff = abs_conf_diff
+      self.max_pct_change = max_pct_change
+      self.y_true = y_true
+      self.y_pred = y_pred
+      self.y_low = y_low
+      self.y_high = y_high
+      self.converged = converged
+
+    def __repr__(self):
+      return 'SessionResult(subjid={}, sessiondate={}, is_anomaly={}, outlier_comp={})'.format(
+          self.subjid, self.sessiondate, self.is_anomaly, list(self.outlier_comp))
+
+class ResultLog:
+    def __init__(self, n_comp = N_COMP, capacity = 1024):
+      self.n_comp = n_comp
+      self.data = np.zeros(capacity, dtype = result_dtype(n_comp))
+      self.size = 0
+      self.n_flushed = 0 # rows already written by flush
+
+    def __len__(self):
+      return self.size
+
+    @property
+    def table(self):
+      # the rows logged so far, a view
+      return self.data[:self.size]
+
+    def __getitem__(self, column):
+      return self.table[column]
+
+    def reserve(self, n_rows):
+      # make room for n_rows more rows, doubling the capacity so appends stay amortised O(1)
+      if self.size + n_rows > len(self.data):
+        data = np.zeros(max(2 * len(self.data), self.size + n_rows), dtype = self.data.dtype)
+        data[:self.size] = self.data[:self.size]
+        self.data = data
+
+    def extend(self, subjid, sessid, sessiondate, row, y_true, y_pred, y_low, y_high, converged,
+               outlier, conf_dist, is_anomaly, max_pct_change):
+      # log a block of sessions at once (e.g. a whole walk-forward), all arguments are arrays with one entry
+      # per session (or scalars for the whole block), per-component ones are sessions x n_comp
+      n_rows = len(row)
+      self.reserve(n_rows)
+      block = self.data[self.size:self.size + n_rows]
+      block['subjid'], block['sessid'], block['row'] = subjid, sessid, row
+      block['sessiondate'] = np.asarray(sessiondate, dtype = 'M8[D]') if sessiondate is not None else np.datetime64('NaT')
+      block['y_true'], block['y_pred'], block['y_low'], block['y_high'] = y_true, y_pred, y_low, y_high
+      block['converged'], block['outlier'], block['conf_dist'] = converged, outlier, conf_dist
+      block['is_anomaly'], block['n_outlier_comp'] = is_anomaly, np.sum(outlier, axis = 1)
+      block['max_pct_change'] = max_pct_change
+      self.size += n_rows
+
+    def append(self, result):
+      # log one SessionResult
+      outlier = np.zeros(self.n_comp, dtype = bool)
+      conf_dist = np.zeros(self.n_comp)
+      comps = np.asarray(result.outlier_comp, dtype = int) - 1
+      outlier[comps] = True
+      conf_dist[comps] = result.abs_conf_diff
+      self.extend(result.subjid, result.sessid,
+                  None if result.sessiondate is None else [result.sessiondate], [result.row],
+                  result.y_true[None], result.y_pred[None], result.y_low[None], result.y_high[None],
+                  result.converged[None], outlier[None], conf_dist[None], result.is_anomaly, result.max_pct_change)
+
+    def record(self, i):
+      # row i as a SessionResult
+      row = self.table[i]
+      outlier_comp = np.where(row['outlier'])[0] + 1
+      return SessionResult(int(row['subjid']), int(row['sessid']), row['sessiondate'], int(row['row']),
+                           bool(row['is_anomaly']), outlier_comp, row['conf_dist'][outlier_comp - 1],
+                           float(row['max_pct_change']), row['y_true'], row['y_pred'], row['y_low'],
+                           row['y_high'], row['converged'])
+
+    def subject(self, subjid):
+      # the rows of one subject, in the order they were logged
+      return self.table[self.table['subjid'] == subjid]
+
+    def anomalies(self):
+      return self.table[self.table['is_anomaly']]
+
+    def flush(self, root, keep = True):
+      # write the rows logged since the last flush to root as a new chunk file
+      # keep = False then frees them, so a long-running process only holds the unflushed rows
+      os.makedirs(root, exist_ok = True)
+      if self.size > self.n_flushed:
+        n_chunks = len(glob.glob(os.path.join(root, 'results_*.npy')))
+        np.save(os.path.join(root, 'results_{:06d}.npy'.format(n_chunks)), self.data[self.n_flushed:self.size])
+      if keep:
+        self.n_flushed = self.size
+      else:
+        self.size = self.n_flushed = 0
+
+    @classmethod
+    def load(cls, root, mmap = True):
+      # all the chunks flushed to root as one log (the chunks are memory-mapped while they are read)
+      chunks = [np.load(path, mmap_mode = 'r' if mmap else None) for path in sorted(glob.glob(os.path.join(root, 'results_*.npy')))]
+      if not chunks:
+        return cls()
+      log = cls(n_comp = chunks[0].dtype['y_true'].shape[0], capacity = sum(len(chunk) for chunk in chunks))
+      for chunk in chunks:
+        log.data[log.size:log.size + len(chunk)] = chunk
+        log.size += len(chunk)
+      log.n_flushed = log.size
+      return log
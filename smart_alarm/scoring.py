@@ -0,0 +1,60 @@
+# vectorized anomaly scoring: the decisions of RigAlarm.detect_outliers for a whole backtest at once
+# all inputs are (sessions x comps) arrays, e.g. collected from RigAlarm.walk_forward
+import numpy as np
+
+from .core import COMP_THRESHOLD, KEY_FEATURES
+
+def outlier_votes(y_true, y_low, y_high, converged = None):
+  # outlier mask, distance to the interval (0 inside it) and number of outlier components per session
+  # components that did not converge never vote
+  below = y_true < y_low
+  above = y_true > y_high
+  outliers = below | above
+  if converged is not None:
+    outliers = outliers & converged
+  conf_dist = np.where(below, y_low - y_true, np.where(above, y_true - y_high, 0.0)) * outliers
+  return outliers, conf_dist, outliers.sum(axis = -1)
+
+def pct_change(features, feature_names, rows, columns = KEY_FEATURES):
+  # % change of columns between each session (row of the clean features) and the session before it
+  # same arithmetic as detect_outliers: x/0 gives +-inf, 0/0 gives nan
+  features = np.asarray(features, dtype = 'float64')
+  rows = np.asarray(rows)
+  col_index = [list(feature_names).index(col) for col in columns]
+  current = features[rows][:, col_index]
+  previous = np.where((rows > 0)[:, None], features[np.maximum(rows - 1, 0)][:, col_index], np.nan)
+  with np.errstate(divide = 'ignore', invalid = 'ignore'):
+    return (current - previous) / previous * 100
+
+def max_pct_change(pct):
+  # largest |% change| of each session, nans ignored (nan if all of them are nan)
+  abs_pct = np.abs(pct)
+  all_nan = np.all(np.isnan(abs_pct), axis = 1)
+  max_pct = np.max(np.where(np.isnan(abs_pct), -np.inf, abs_pct), axis = 1)
+  return np.where(all_nan, np.nan, max_pct)
+
+def anomaly_decision(votes, max_pct, comp_threshold = COMP_THRESHOLD, pct_change_threshold = 60):
+  # more than comp_threshold outlier components, and the key feature gate: the largest |% change| must reach 
+  # pct_change_threshold. like detect_outliers, a session whose changes are all nan keeps its anomaly status
+  return (votes > comp_threshold) & ~(max_pct < pct_change_threshold)
+
+def score_sessions(y_true, y_low, y_high, features, feature_names, rows, converged = None, 
+                   comp_threshold = COMP_THRESHOLD, key_features = KEY_FEATURES, pct_change_threshold = 60):
+  # y_*: (sessions x comps) true component values and interval bounds, converged: same shape (or None)
+  # features: the clean feature matrix (RigAlarm.clean_df values, float64 for exact parity), rows: the row 
+  # of each scored session in it (pct changes are taken against the row before)
+  # returns a dict of arrays, one entry per session
+  outliers, conf_dist, votes = outlier_votes(y_true, y_low, y_high, converged)
+  pct = pct_change(features, feature_names, rows, key_features)
+  max_pct = max_pct_change(pct)
+  is_anomaly = anomaly_decision(votes, max_pct, comp_threshold, pct_change_threshold)
+  return {'outliers': outliers, 'conf_dist': conf_dist, 'votes': votes, 'pct_change': pct, 
+          'max_pct_change': max_pct, 'is_anomaly': is_anomaly}
+
+def score_rigalarm(ra, pred_index, y_true, y_low, y_high, converged = None):
+  # score_sessions with the clean features and thresholds of a fitted RigAlarm
+  # pred_index are the (negative) indices of the sessions, as yielded by walk_forward
+  rows = np.asarray(pred_index) + ra.clean_df.shape[0]
+  return score_sessions(y_true, y_low, y_high, ra.clean_df.to_numpy(dtype = 'float64'), ra.clean_df.columns, rows,
+                        converged = converged, comp_threshold = ra.comp_threshold, 
+                        key_features = ra.key_features, pct_change_threshold = ra.pct_change_threshold)
@@ -0,0 +1,79 @@
+# columnar on-disk session store
+# the session export is sorted by subject once and written as .npy files: one float32 row-major matrix with 
+# the feature columns (everything preprocess keeps) and one array per id/metadata column we still need.
+# a subjid -> row range index makes loading a subject a slice of memory-mapped arrays, no scan and no copy
+import os
+import json
+import numpy as np
+import pandas as pd
+
+from .core import META_COLUMNS
+
+# metadata columns kept next to the features (for reporting, alerting and cohorts)
+STORE_META_COLUMNS = ['sessid', 'subjid', 'sessiondate', 'rigid', 'protocol', 'expgroup']
+
+class SessionStore:
+    def __init__(self, root):
+      # open an existing store, all the arrays are memory-mapped read-only
+      self.root = root
+      with open(os.path.join(root, 'manifest.json')) as f:
+        self.manifest = json.load(f)
+      self.feature_names = self.manifest['feature_names']
+      self.meta_names = self.manifest['meta_names']
+      self.features = np.load(os.path.join(root, 'features.npy'), mmap_mode = 'r')
+      self.meta = {col: np.load(os.path.join(root, 'meta_{}.npy'.format(col)), mmap_mode = 'r') 
+                   for col in self.meta_names}
+      index = np.load(os.path.join(root, 'index.npy'))
+      self.index = {int(subjid): (int(start), int(stop)) for subjid, start, stop in index}
+
+    @classmethod
+    def build(cls, sessions, root):
+      # sessions is the session table (or the path of its csv export)
+      # rows are grouped by subject, keeping the original (chronological) order within each subject
+      if isinstance(sessions, str):
+        sessions = pd.read_csv(sessions)
+      sessions = sessions.sort_values('subjid', kind = 'stable').reset_index(drop = True)
+      feature_names = [col for col in sessions.columns if col not in META_COLUMNS]
+      meta_names = [col for col in STORE_META_COLUMNS if col in sessions.columns]
+      os.makedirs(root, exist_ok = True)
+      np.save(os.path.join(root, 'features.npy'), 
+              np.ascontiguousarray(sessions[feature_names].to_numpy(dtype = 'float32')))
+      for col in meta_names:
+        values = sessions[col].to_numpy()
+        if values.dtype == object: # strings are stored fixed width so they can be memory-mapped too
+          values = values.astype('U')
+        np.save(os.path.join(root, 'meta_{}.npy'.format(col)), values)
+
+      # the subject index: row ranges of the (now contiguous) subjects
+      subjids, starts, counts = np.unique(sessions['subjid'].to_numpy(), return_index = True, return_counts = True)
+      np.save(os.path.join(root, 'index.npy'), np.stack([subjids, starts, starts + counts], axis = 1).astype('int64'))
+      with open(os.path.join(root, 'manifest.json'), 'w') as f:
+        json.dump({'feature_names': feature_names, 'meta_names': meta_names, 'n_rows': len(sessions)}, f, indent = 1)
+      return cls(root)
+
+    def subjects(self):
+      return np.array(sorted(self.index))
+
+    def subject_array(self, subjid):
+      # the raw (not yet preprocessed) float32 features of a subject, a view into the memory map
+      start, stop = self.index[int(subjid)]
+      return self.features[start:stop]
+
+    def subject_frame(self, subjid):
+      # the subject's sessions as a DataFrame that RigAlarm.run / preprocess accept
+      start, stop = self.index[int(subjid)]
+      frame = pd.DataFrame(self.features[start:stop], columns = self.feature_names, copy = False)
+      for col in self.meta_names:
+        frame[col] = self.meta[col][start:stop]
+      return frame
+
+    def groups(self):
+      # (subjid, frame) pairs, like DataFrame.groupby('subjid')
+      for subjid in self.subjects():
+        yield subjid, self.subject_frame(subjid)
+
+def subject_sessions(sessions, subjid):
+  # the sessions of one subject, from either a SessionStore or a plain session table
+  if isinstance(sessions, SessionStore):
+    return sessions.subject_frame(subjid)
+  return sessions[sessions.subjid == subjid]
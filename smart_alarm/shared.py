@@ -0,0 +1,118 @@
+# colony-wide arrays shared by the worker processes
+# the clean features of every subject (what preprocess returns) go into one float32 memory-mapped matrix and
+# the ForeCA scores into one float64 matrix next to it, a subject is a row range of both
+# workers only receive the directory and a subjid: they attach to the files and work on zero-copy views,
+# so memory stays flat however many workers there are (put root on /dev/shm to keep it off the disk)
+import os
+import json
+import numpy as np
+import pandas as pd
+from numpy.lib.format import open_memmap
+
+from .core import RigAlarm, N_COMP, cohort_key
+from .sessions import SessionStore
+
+ATTACHED = {} # root -> SharedColony, one per worker process
+
+class SharedColony:
+    def __init__(self, root):
+      # open the arrays of an existing shared colony, the features read-only and the scores writable
+      self.root = root
+      with open(os.path.join(root, 'manifest.json')) as f:
+        self.manifest = json.load(f)
+      self.feature_names = self.manifest['feature_names']
+      self.features = np.load(os.path.join(root, 'features.npy'), mmap_mode = 'r')
+      self.scores = np.load(os.path.join(root, 'scores.npy'), mmap_mode = 'r+')
+      self.sessids = np.load(os.path.join(root, 'sessids.npy'), mmap_mode = 'r')
+      self.sessiondates = np.load(os.path.join(root, 'sessiondates.npy'), mmap_mode = 'r')
+      self.rigids = np.load(os.path.join(root, 'rigids.npy'), mmap_mode = 'r')
+      index = np.load(os.path.join(root, 'index.npy'))
+      self.index = {int(subjid): (int(start), int(stop)) for subjid, start, stop in index[:, :3]}
+      self.n_sessions = {int(subjid): int(n) for subjid, n in index[:, [0, 3]]}
+      self.cohort_keys = {int(subjid): tuple(key) for subjid, key in self.manifest['cohort_keys'].items()}
+
+    @classmethod
+    def build(cls, sessions, root, n_comp = N_COMP, metrics = None):
+      # preprocess every subject of sessions (a session table or a SessionStore) once, straight into the
+      # shared feature matrix, and allocate the ForeCA scores (nan until a worker fills them in)
+      if isinstance(sessions, SessionStore):
+        groups, n_raw = sessions.groups(), sessions.manifest['n_rows']
+      else:
+        groups, n_raw = sessions.groupby('subjid', sort = True), len(sessions)
+      os.makedirs(root, exist_ok = True)
+      features, feature_names = None, None
+      index, sessids, sessiondates, rigids, cohort_keys = [], [], [], [], {}
+      n_rows = 0
+      for subjid, sess_df in groups:
+        ra = RigAlarm(subjid, metrics = metrics)
+        clean_array = ra.preprocess(sess_df)
+        if features is None: # every subject has the same columns, the raw row count bounds the clean one
+          feature_names = list(ra.clean_df.columns)
+          features = open_memmap(os.path.join(root, 'features.npy'), mode = 'w+', dtype = 'float32',
+                                 shape = (n_raw, len(feature_names)))
+        features[n_rows:n_rows + clean_array.shape[0]] = clean_array
+        index.append((subjid, n_rows, n_rows + clean_array.shape[0], sess_df.shape[0]))
+        cohort_keys[str(subjid)] = [value.item() if hasattr(value, 'item') else value for value in cohort_key(sess_df)]
+        sessids.append(sess_df.loc[ra.clean_df.index, 'sessid'].to_numpy('int64'))
+        if 'sessiondate' in sess_df.columns:
+          sessiondates.append(sess_df.loc[ra.clean_df.index, 'sessiondate'].to_numpy().astype('U'))
+        else:
+          sessiondates.append(np.full(clean_array.shape[0], '', dtype = 'U1'))
+        if 'rigid' in sess_df.columns: # -1 where it is not known
+          rigids.append(sess_df.loc[ra.clean_df.index, 'rigid'].fillna(-1).to_numpy('int64'))
+        else:
+          rigids.append(np.full(clean_array.shape[0], -1, dtype = 'int64'))
+        n_rows += clean_array.shape[0]
+      if features is None:
+        raise ValueError('No sessions to share')
+      features.flush()
+      del features
+
+      scores = open_memmap(os.path.join(root, 'scores.npy'), mode = 'w+', dtype = 'float64', shape = (n_rows, n_comp))
+      scores[:] = np.nan
+      scores.flush()
+      del scores
+      np.save(os.path.join(root, 'sessids.npy'), np.concatenate(sessids))
+      np.save(os.path.join(root, 'sessiondates.npy'), np.concatenate(sessiondates))
+      np.save(os.path.join(root, 'rigids.npy'), np.concatenate(rigids))
+      np.save(os.path.join(root, 'index.npy'), np.array(index, dtype = 'int64').reshape(-1, 4))
+      with open(os.path.join(root, 'manifest.json'), 'w') as f:
+        json.dump({'feature_names': feature_names, 'n_rows': n_rows, 'n_comp': n_comp, 'cohort_keys': cohort_keys}, f, indent = 1)
+      return cls(root)
+
+    @classmethod
+    def attach(cls, root):
+      # the SharedColony at root, opened once per process
+      if root not in ATTACHED:
+        ATTACHED[root] = cls(root)
+      return ATTACHED[root]
+
+    def subjects(self):
+      return np.array(sorted(self.index))
+
+    def subject_features(self, subjid):
+      # the clean float32 features of a subject, a read-only view into the shared matrix
+      start, stop = self.index[int(subjid)]
+      return self.features[start:stop]
+
+    def subject_frame(self, subjid):
+      # the same as a DataFrame, like RigAlarm.clean_df (no copy)
+      return pd.DataFrame(self.subject_features(subjid), columns = self.feature_names, copy = False)
+
+    def subject_scores(self, subjid):
+      # the ForeCA scores of a subject, a writable view into the shared matrix
+      start, stop = self.index[int(subjid)]
+      return self.scores[start:stop]
+
+    def subject_sessids(self, subjid):
+      start, stop = self.index[int(subjid)]
+      return self.sessids[start:stop]
+
+    def subject_sessiondates(self, subjid):
+      start, stop = self.index[int(subjid)]
+      return self.sessiondates[start:stop]
+
+    def subject_rigids(self, subjid):
+      # the rig of every clean session, None where it is not known
+      start, stop = self.index[int(subjid)]
+      return [None if rigid < 0 else int(rigid) for rigid in self.rigids[start:stop]]
@@ -0,0 +1,50 @@
+import os
+import json
+import numpy as np
+
+# persistent per-subject ForeCA models
+# each subject gets one .npz file (projection matrix, loadings, scores so far, feature stats)
+# and a small .json next to it with the fit metadata, so we can decide when to refit without opening the npz
+# nothing is shared between subjects, so the workers of run_colony can save their subjects at the same time
+class ForeCAModelStore:
+    def __init__(self, root):
+      self.root = root
+      os.makedirs(root, exist_ok = True)
+      # stores written before the per-subject metadata kept it all in manifest.json, still read as a fallback
+      self.manifest = {}
+      manifest_path = os.path.join(root, 'manifest.json')
+      if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+          self.manifest = json.load(f)
+
+    def model_path(self, subjid):
+      return os.path.join(self.root, 'foreca_{}.npz'.format(subjid))
+
+    def meta_path(self, subjid):
+      return os.path.join(self.root, 'foreca_{}.json'.format(subjid))
+
+    def save(self, subjid, model, meta):
+      # model is a dict of arrays, meta is a json-able dict
+      # write to temporary files first so a crash never leaves a half written model behind,
+      # the metadata goes last so it only exists once its model is complete
+      tmp_path = self.model_path(subjid) + '.tmp.npz'
+      np.savez(tmp_path, **model)
+      os.replace(tmp_path, self.model_path(subjid))
+      with open(self.meta_path(subjid) + '.tmp', 'w') as f:
+        json.dump(meta, f, indent = 1)
+      os.replace(self.meta_path(subjid) + '.tmp', self.meta_path(subjid))
+
+    def load_meta(self, subjid):
+      if os.path.exists(self.meta_path(subjid)):
+        with open(self.meta_path(subjid)) as f:
+          return json.load(f)
+      return self.manifest.get(str(subjid))
+
+    def load(self, subjid):
+      # returns (model, meta), or (None, None) if this subject was never fitted
+      meta = self.load_meta(subjid)
+      if meta is None or not os.path.exists(self.model_path(subjid)):
+        return None, None
+      with np.load(self.model_path(subjid)) as npz:
+        model = {key: npz[key] for key in npz.files}
+      return model, meta
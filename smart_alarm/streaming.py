@@ -0,0 +1,123 @@
+import os
+import sys
+import glob
+import json
+import time
+import pandas as pd
+
+from .core import RigAlarm, cohort_key
+from .alerts import make_alert
+from .preprocess import Preprocessor
+
+# streaming mode: a long-lived service that scores each session as soon as its row arrives
+# per subject it keeps the fitted RigAlarm (so the ForeCA projection) and a Preprocessor with the clean rows,
+# so a new session costs one row of cleaning, one projection of the window, one batch ARIMA fit and the outlier check
+class AlarmService:
+    def __init__(self, out = sys.stdout, alerts = None, **ra_kwargs):
+      # ra_kwargs are passed on to RigAlarm, the numpy backend and batch forecaster keep the latency in milliseconds
+      # alerts: an AlertDispatcher, every scored session is submitted to it (it is not waited on)
+      # a session is scored as it arrives, so there is no horizon to forecast
+      if ra_kwargs.get('horizon', 1) != 1:
+        raise ValueError('AlarmService scores one session at a time, horizon must be 1')
+      ra_kwargs.setdefault('backend', 'numpy')
+      ra_kwargs.setdefault('forecaster', 'batch')
+      self.ra_kwargs = ra_kwargs
+      self.out = out # where the decisions are written, as json lines
+      self.alerts = alerts
+      self.states = {} # subjid -> rolling state
+      self.pending = {} # subjid -> raw rows of subjects that don't have enough history yet
+
+    def bootstrap(self, sess_df):
+      # fit (or load from the model store) one subject from its history and keep the rolling state
+      subjid = sess_df.subjid.iloc[0]
+      ra = RigAlarm(subjid, pred_index = -1, **self.ra_kwargs)
+      preprocessor = Preprocessor(subjid = subjid, metrics = ra.metrics)
+      clean_array = preprocessor.fit(sess_df) # the same array as ra.preprocess(sess_df)
+      ra.clean_df = preprocessor.frame()
+      ra.cohort_key_ = cohort_key(sess_df)
+      ra.fit_or_project(clean_array, sess_df.loc[preprocessor.labels, 'sessid'].to_numpy())
+      self.states[subjid] = {'ra': ra, 'preprocessor': preprocessor}
+      self.pending.pop(subjid, None)
+
+    def bootstrap_colony(self, df):
+      for _, sess_df in df.groupby('subjid', sort = True):
+        self.bootstrap(sess_df)
+
+    def ingest(self, row):
+      # score a single new session (a dict with the same fields as the session table) and return the decision
+      start = time.perf_counter()
+      subjid = row['subjid']
+      decision = {'subjid': subjid, 'sessid': row.get('sessid'), 'sessiondate': row.get('sessiondate'), 
+                  'status': 'scored', 'is_anomaly': False, 'outlier_comp': []}
+      state = self.states.get(subjid)
+      if state is None: # new subject, wait until there is enough history to fit it
+        rows = self.pending.setdefault(subjid, [])
+        rows.append(row)
+        decision['status'] = 'warming up'
+        min_rows = RigAlarm(subjid, **self.ra_kwargs).w_width + 1
+        if len(rows) >= min_rows:
+          try:
+            self.bootstrap(pd.DataFrame(rows))
+          except Exception as e:
+            decision['status'] = 'bootstrap failed: {}'.format(e)
+      else:
+        # a bad row (e.g. a mass that is not a number) or a failed fit only costs this session, not the service
+        try:
+          self.score(state, row, decision)
+        except Exception as e:
+          decision['status'] = 'error: {}: {}'.format(type(e).__name__, e)
+      decision['latency_ms'] = (time.perf_counter() - start) * 1000
+      self.emit(decision)
+      return decision
+
+    def score(self, state, row, decision):
+      # clean the new session, forecast it from the w_width before and fill in the decision
+      preprocessor = state['preprocessor']
+      if preprocessor.append(row, label = row.get('sessid')) is None: # no total_profit or too short
+        decision['status'] = 'filtered'
+        return
+      ra = state['ra']
+      subjid = row['subjid']
+      # w_width sessions + today's, projected again as the leading missing masses can change with a new one
+      ra.foreca_scores_ = ra.project(preprocessor.array[-(ra.w_width + 1):])
+      ra.clean_df = preprocessor.frame(-2)
+      ra.is_anomaly = False
+      ra.arima_predict()
+      ra.detect_outliers()
+      decision['is_anomaly'] = bool(ra.is_anomaly)
+      decision['outlier_comp'] = [int(c) for c in ra.outlier_comp]
+      if self.alerts is not None:
+        self.alerts.submit(make_alert(subjid, row.get('sessiondate'), ra.is_anomaly, ra.outlier_comp, ra.abs_conf_diff_,
+                                      ra.diff_df if ra.is_anomaly else None, rigid = row.get('rigid')))
+
+    def emit(self, decision):
+      self.out.write(json.dumps(decision, default = lambda x: x.item() if hasattr(x, 'item') else str(x)) + '\n')
+      self.out.flush()
+
+    def serve_jsonl(self, stream = sys.stdin):
+      # one session per line as a json object, e.g. piped from the rig computers
+      for line in stream:
+        if not line.strip():
+          continue
+        try:
+          row = json.loads(line)
+        except ValueError as e: # a truncated line, reported and skipped
+          self.emit({'status': 'error: {}: {}'.format(type(e).__name__, e), 'line': line.strip()})
+          continue
+        self.ingest(row)
+
+    def watch_directory(self, path, poll_interval = 1.0, pattern = '*.jsonl'):
+      # pick up every new file that lands in path (json lines, or csv with the session table columns)
+      seen = set()
+      while True:
+        for file_name in sorted(glob.glob(os.path.join(path, pattern))):
+          if file_name in seen:
+            continue
+          seen.add(file_name)
+          if file_name.endswith('.csv'):
+            for row in pd.read_csv(file_name).to_dict('records'):
+              self.ingest(row)
+          else:
+            with open(file_name) as f:
+              self.serve_jsonl(f)
+        time.sleep(poll_interval)
@@ -0,0 +1,140 @@
+# hyperparameter sweep: detection metrics of every (n_comp, w_width, n_steps, comp_threshold, pct_change_threshold)
+# against labelled anomalies, written as one results table, e.g.
+#   python -m smart_alarm.sweep sessions.csv labels.csv --n-comp 4,6,8 --w-width 40,60,80 --out sweep.csv
+# (without the csv files it sweeps a synthetic colony with injected anomalies)
+# the expensive steps are shared between the configurations:
+# - preprocess runs once per subject
+# - ForeCA runs once per subject with the largest n_comp, a smaller n_comp uses the components found first
+#   (the components are extracted one after the other, so they are nested, see foreca_numpy)
+# - the walk-forward ARIMA runs once per (w_width, n_steps) on all the components, every n_comp, comp_threshold
+#   and pct_change_threshold is scored from the same forecasts
+# the subjects are spread over a process pool (the one of run_colony, a subject that crashes its worker is left out)
+import argparse
+import logging
+import itertools
+import numpy as np
+import pandas as pd
+
+from .core import RigAlarm, N_COMP, W_WIDTH, COMP_THRESHOLD
+from .colony import run_pool
+from .backtest import collect_walk_forward
+from .sessions import SessionStore
+from .scoring import outlier_votes, pct_change, max_pct_change, anomaly_decision
+from .synthetic import make_colony
+
+logger = logging.getLogger(__name__)
+
+PARAM_NAMES = ['n_comp', 'w_width', 'n_steps', 'comp_threshold', 'pct_change_threshold']
+# RigAlarm's defaults, used for the parameters that are not swept
+DEFAULT_GRID = {'n_comp': [N_COMP], 'w_width': [W_WIDTH], 'n_steps': [3],
+                'comp_threshold': [COMP_THRESHOLD], 'pct_change_threshold': [60]}
+# what the command line sweeps by default
+SWEEP_GRID = {'n_comp': [4, 6, 8], 'w_width': [40, 60, 80], 'n_steps': [2, 3],
+              'comp_threshold': [1, 2, 3], 'pct_change_threshold': [30, 60, 90]}
+
+def sweep_configs(grid, n_random = None, seed = 0):
+  # every combination of the values in grid (parameter name -> list of values),
+  # or n_random of them drawn without replacement. one row per configuration
+  grid = dict(DEFAULT_GRID, **grid)
+  configs = list(itertools.product(*[grid[name] for name in PARAM_NAMES]))
+  if n_random is not None and n_random < len(configs):
+    rng = np.random.default_rng(seed)
+    configs = [configs[i] for i in np.sort(rng.choice(len(configs), n_random, replace = False))]
+  return pd.DataFrame(configs, columns = PARAM_NAMES)
+
+def sweep_subject(subjid, sess_df, labels, configs, ra_kwargs):
+  # detection counts of every configuration on one subject: true_pos, false_pos, n_anomalies, n_scored
+  # only the sessions after the largest w_width are scored, so all the configurations see the same sessions
+  # sessions without a label are not scored
+  counts = np.zeros((len(configs), 4), dtype = int)
+  ra = RigAlarm(subjid, n_comp = int(configs.n_comp.max()), **ra_kwargs)
+  clean_array = ra.preprocess(sess_df)
+  n_rows = clean_array.shape[0]
+  first = int(configs.w_width.max()) - n_rows # pred_index of the first scored session
+  if first >= 0:
+    return counts
+  ra.foreCA(clean_array)
+  sessids = sess_df.loc[ra.clean_df.index, 'sessid'].to_numpy()[first:]
+  label = pd.Series(labels.is_anomaly.to_numpy(), index = labels.sessid).reindex(sessids)
+  scored = label.notna().to_numpy()
+  is_labelled = label.fillna(False).to_numpy(dtype = bool)[scored]
+
+  # the key feature changes do not depend on any of the swept parameters
+  max_pct = max_pct_change(pct_change(ra.clean_df.to_numpy(dtype = 'float64'), ra.clean_df.columns,
+                                      np.arange(n_rows + first, n_rows), ra.key_features))[scored]
+
+  for (w_width, n_steps), group in configs.groupby(['w_width', 'n_steps']):
+    ra.w_width, ra.n_steps = int(w_width), int(n_steps)
+    pred_index, y_true, _, y_low, y_high, converged = collect_walk_forward(ra)
+    keep = np.flatnonzero(pred_index >= first)[scored]
+    for n_comp, sub in group.groupby('n_comp'):
+      comps = np.flatnonzero(ra.foreca_order_ < n_comp)
+      _, _, votes = outlier_votes(y_true[keep][:, comps], y_low[keep][:, comps], y_high[keep][:, comps],
+                                  converged[keep][:, comps])
+      for i, comp_threshold, pct_change_threshold in zip(sub.index, sub.comp_threshold, sub.pct_change_threshold):
+        detected = anomaly_decision(votes, max_pct, comp_threshold, pct_change_threshold)
+        counts[i] = [np.sum(detected & is_labelled), np.sum(detected & ~is_labelled), np.sum(is_labelled), len(detected)]
+  return counts
+
+def run_sweep(df, labels, grid = {}, n_random = None, seed = 0, workers = 4, max_pending = None,
+              mp_context = None, out = None, **ra_kwargs):
+  # df is the session table of the whole colony (or a SessionStore), labels a table of sessid, is_anomaly
+  # grid maps parameter names to the values to try, the parameters not in it keep RigAlarm's defaults
+  # ra_kwargs are passed on to RigAlarm, e.g. backend = 'numpy', forecaster = 'batch'
+  # returns the results table (written to the csv file out if given), best f1 first
+  configs = sweep_configs(grid, n_random, seed)
+  if max_pending is None:
+    max_pending = 2 * workers
+  if isinstance(df, SessionStore):
+    groups = df.groups()
+  else:
+    groups = iter(df.groupby('subjid', sort = True))
+
+  def crashed(subjid, sess_df):
+    logger.warning('Subject %s crashed its worker process twice, it is left out of the sweep.', subjid)
+    return np.zeros((len(configs), 4), dtype = int)
+
+  counts = sum(run_pool(sweep_subject, groups, workers, max_pending, mp_context, (labels, configs, ra_kwargs),
+                        on_crash = crashed), np.zeros((len(configs), 4), dtype = int))
+
+  results = configs.copy()
+  results['true_pos'], results['false_pos'], results['n_anomalies'], results['n_scored'] = counts.T
+  results['n_detected'] = results.true_pos + results.false_pos
+  results['precision'] = results.true_pos / results.n_detected.clip(lower = 1)
+  results['recall'] = results.true_pos / results.n_anomalies.clip(lower = 1)
+  results['f1'] = 2 * results.true_pos / (results.n_detected + results.n_anomalies).clip(lower = 1)
+  results = results.sort_values(['f1', 'precision'], ascending = False).reset_index(drop = True)
+  if out is not None:
+    results.to_csv(out, index = False)
+  return results
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(prog = 'smart_alarm.sweep')
+  parser.add_argument('sessions', nargs = '?', default = None, help = 'csv export of the sessions, synthetic colony if not given')
+  parser.add_argument('labels', nargs = '?', default = None, help = 'csv with sessid, is_anomaly')
+  for name in PARAM_NAMES:
+    parser.add_argument('--' + name.replace('_', '-'), default = ','.join(str(v) for v in SWEEP_GRID[name]))
+  parser.add_argument('--random', type = int, default = None, help = 'only try this many random configurations')
+  parser.add_argument('--workers', type = int, default = 4)
+  parser.add_argument('--backend', default = 'numpy', choices = ['numpy', 'r'])
+  parser.add_argument('--forecaster', default = 'batch', choices = ['batch', 'statsmodels'])
+  parser.add_argument('--subjects', type = int, default = 8, help = 'size of the synthetic colony')
+  parser.add_argument('--sessions-per-subject', type = int, default = 300)
+  parser.add_argument('--seed', type = int, default = 0)
+  parser.add_argument('--out', default = None, help = 'csv file for the results table')
+  args = parser.parse_args(argv)
+
+  if args.sessions is None:
+    df, labels = make_colony(args.subjects, args.sessions_per_subject, seed = args.seed)
+  else:
+    if args.labels is None:
+      parser.error('a labels csv is needed with a sessions csv')
+    df, labels = pd.read_csv(args.sessions), pd.read_csv(args.labels)
+  grid = {name: [int(v) for v in getattr(args, name).split(',')] for name in PARAM_NAMES}
+  results = run_sweep(df, labels, grid, n_random = args.random, seed = args.seed, workers = args.workers,
+                      out = args.out, backend = args.backend, forecaster = args.forecaster)
+  if args.out is None:
+    print(results.to_string())
+
+if __name__ == "__main__":
+  main()
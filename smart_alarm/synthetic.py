@@ -0,0 +1,67 @@
+# synthetic colony generator, for benchmarks and parameter sweeps
+# every subject gets a few slowly varying latent factors (motivation, accuracy, ...) that drive all the 
+# session features, like in the real session table; known anomalies are injected as a sudden collapse 
+# of the key features (trials, profit, hits and the pokes that go with them)
+import numpy as np
+import pandas as pd
+
+POKE_COLUMNS = ['TopLin', 'TopRin', 'MidLin', 'MidCin', 'MidRin', 'BotLin', 'BotCin', 'BotRin']
+
+def make_subject(rng, subjid, n_sessions, n_extra, anomaly_rate, first_anomaly, sessid_start):
+  # latent AR(1) factors, plus a learning curve on the number of trials
+  factors = np.zeros((n_sessions, 3))
+  for t in range(1, n_sessions):
+    factors[t] = 0.9 * factors[t - 1] + rng.normal(scale = 0.3, size = 3)
+  learning = 1 - np.exp(-np.arange(n_sessions) / (n_sessions / 5))
+
+  num_trials = np.clip(80 + 150 * learning + 40 * factors[:, 0] + rng.normal(scale = 15, size = n_sessions), 1, None)
+  hits = np.clip(55 + 10 * factors[:, 1] + rng.normal(scale = 5, size = n_sessions), 0, 100)
+  viols = np.clip(30 - 8 * factors[:, 1] + 5 * factors[:, 2] + rng.normal(scale = 5, size = n_sessions), 0, 100)
+  sess_min = np.where(rng.random_sample(n_sessions) < 0.02, rng.uniform(5, 50, n_sessions), 
+                      rng.normal(80, 5, n_sessions))
+  mass = 250 + np.cumsum(rng.normal(0.2, 1.5, n_sessions))
+  mass[rng.random_sample(n_sessions) < 0.02] = np.nan
+
+  # inject the anomalies, only after the first w_width sessions so they can be detected
+  is_anomaly = np.zeros(n_sessions, dtype = bool)
+  candidates = np.arange(first_anomaly, n_sessions)
+  n_anomalies = rng.binomial(len(candidates), anomaly_rate) if len(candidates) > 0 else 0
+  is_anomaly[rng.choice(candidates, n_anomalies, replace = False)] = True
+  collapse = np.where(is_anomaly, rng.uniform(0.1, 0.3, n_sessions), 1.0)
+  num_trials = np.maximum(np.round(num_trials * collapse), 1)
+  hits = hits * collapse
+
+  pokes = {'TopLin': rng.poisson(2, n_sessions), 'TopRin': rng.poisson(2, n_sessions), 
+           'MidLin': rng.poisson(2, n_sessions), 'MidRin': rng.poisson(2, n_sessions),
+           'MidCin': rng.poisson(2.0 * num_trials), 'BotCin': rng.poisson(1.3 * num_trials),
+           'BotLin': rng.poisson(0.5 * num_trials * (1 + 0.2 * np.tanh(factors[:, 2])))}
+  pokes['BotRin'] = rng.poisson(0.5 * num_trials * (1 - 0.2 * np.tanh(factors[:, 2])))
+  extra = {'Poke{}'.format(k): rng.poisson(0.3 * num_trials * rng.uniform(0.5, 1.5)) for k in range(n_extra)}
+
+  sessiondate = pd.Timestamp('2018-01-01') + pd.to_timedelta(np.arange(n_sessions), unit = 'D')
+  sess_df = pd.DataFrame({'sessid': sessid_start + np.arange(n_sessions), 'subjid': subjid, 
+                          'num_trials': num_trials, 'total_profit': np.round(num_trials * hits / 100) * 25,
+                          'hits': hits, 'viols': viols, 'sess_min': sess_min,
+                          'sessiondate': sessiondate.strftime('%Y-%m-%d'), 
+                          'protocol': 'Operant', 'rigid': rng.randint(1, 112, n_sessions),
+                          'mass': mass, 'species': 'rat', 'expgroup': 'cohort{}'.format(subjid % 2)})
+  for col in POKE_COLUMNS + list(extra):
+    sess_df[col] = pokes[col] if col in pokes else extra[col]
+  labels = pd.DataFrame({'subjid': subjid, 'sessid': sess_df.sessid, 'is_anomaly': is_anomaly})
+  return sess_df, labels
+
+def make_colony(n_subjects = 10, n_sessions = 300, n_features = 14, anomaly_rate = 0.02, first_anomaly = 70, seed = 0):
+  # session table of a synthetic colony with the same columns as the real export, and the anomaly labels
+  # n_features is the number of behavioural feature columns (14 is the real set, more adds extra poke columns)
+  # n_sessions can be a number or a (min, max) range per subject
+  rng = np.random.RandomState(seed)
+  n_extra = max(n_features - 6 - len(POKE_COLUMNS), 0)
+  frames, labels = [], []
+  sessid_start = 1
+  for i in range(n_subjects):
+    n_sess = n_sessions if np.isscalar(n_sessions) else rng.randint(n_sessions[0], n_sessions[1] + 1)
+    sess_df, subj_labels = make_subject(rng, 3000 + i, n_sess, n_extra, anomaly_rate, first_anomaly, sessid_start)
+    frames.append(sess_df)
+    labels.append(subj_labels)
+    sessid_start += n_sess
+  return pd.concat(frames, ignore_index = True), pd.concat(labels, ignore_index = True)
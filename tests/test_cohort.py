@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from smart_alarm import RigAlarm, fit_cohorts, run_colony
+from smart_alarm.synthetic import make_colony
+
+RA_KWARGS = {'backend': 'numpy', 'forecaster': 'batch'}
+
+def colony_with_new_animals():
+  # an established colony and a cohort of two new animals with 10 sessions each
+  df, _ = make_colony(n_subjects = 6, n_sessions = 150)
+  new, _ = make_colony(n_subjects = 2, n_sessions = 10, seed = 3)
+  new['subjid'] += 100
+  new['sessid'] += 10000
+  new['expgroup'] = 'new'
+  return pd.concat([df, new], ignore_index = True)
+
+def test_cohorts_without_enough_history_fall_back_to_a_wider_one():
+  df = colony_with_new_animals()
+  cohorts = fit_cohorts(df)
+  assert ('Operant', 'new') not in cohorts
+  assert () in cohorts and ('Operant',) in cohorts
+  sess_df = df[df.subjid == 3100]
+  ra = RigAlarm(3100, cohort = cohorts, **RA_KWARGS)
+  ra.run(sess_df)
+  assert ra.cohort_model() is cohorts[('Operant',)]
+
+def test_unknown_cohort_uses_the_colony_model():
+  df = colony_with_new_animals()
+  cohorts = fit_cohorts(df)
+  sess_df = df[df.subjid == 3101].iloc[:5].assign(protocol = 'Classical')
+  ra = RigAlarm(3101, cohort = cohorts, **RA_KWARGS)
+  ra.run(sess_df)
+  assert ra.cohort_model() is cohorts[()]
+  assert ra.foreca_scores_.shape[0] == ra.clean_df.shape[0]
+
+def test_short_histories():
+  df = colony_with_new_animals()
+  cohorts = fit_cohorts(df)
+  sess_df = df[df.subjid == 3100]
+  for n_sess, converged in [(1, False), (2, False), (3, True)]:
+    ra = RigAlarm(3100, cohort = cohorts, **RA_KWARGS)
+    ra.run(sess_df.iloc[:n_sess])
+    assert np.all(ra.converged_ == converged)
+
+def test_walk_forward_starts_at_the_third_session():
+  df = colony_with_new_animals()
+  cohorts = fit_cohorts(df)
+  sess_df = df[df.subjid == 3100]
+  ra = RigAlarm(3100, cohort = cohorts, **RA_KWARGS)
+  ra.fit_or_project(ra.preprocess(sess_df), sess_df.sessid.to_numpy())
+  steps = list(ra.walk_forward())
+  assert steps[0][0] == 2 - ra.clean_df.shape[0]
+  assert all(np.all(step[-1]) for step in steps)
+
+def test_shared_colony_uses_the_cohorts():
+  df = colony_with_new_animals()
+  cohorts = fit_cohorts(df)
+  reports = [run_colony(df, workers = 2, shared = shared, cohort = cohorts, **RA_KWARGS) for shared in [False, True]]
+  for report in reports:
+    assert report.error.isna().all()
+  columns = ['subjid', 'is_anomaly', 'n_outlier_comp', 'outlier_comp', 'abs_conf_diff']
+  pd.testing.assert_frame_equal(reports[0][columns], reports[1][columns], check_exact = False)
+
+def test_statsmodels_starts_from_the_cohort_parameters():
+  pytest.importorskip('statsmodels')
+  df = colony_with_new_animals()
+  cohorts = fit_cohorts(df)
+  sess_df = df[df.subjid == df.subjid.iloc[0]]
+  ra = RigAlarm(sess_df.subjid.iloc[0], cohort = cohorts, backend = 'numpy', forecaster = 'statsmodels')
+  ra.run(sess_df)
+  warm_start = ra.cohort_model().warm_start(ra.n_comp)
+  assert all(len(start) == len(params) for start, params in zip(warm_start, ra.arima_params_))
+  events = [e for e in ra.metrics.events if e['event'] == 'arima_component']
+  assert [e['error'] for e in events] == [None] * ra.n_comp
+  assert np.all(np.isfinite(ra.y_pred_))
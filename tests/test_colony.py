@@ -0,0 +1,76 @@
+import os
+import json
+import numpy as np
+
+from smart_alarm import RigAlarm, run_colony, AlertDispatcher, FileSink, ResultLog
+from smart_alarm.colony import run_pool
+from smart_alarm.synthetic import make_colony
+
+RA_KWARGS = {'backend': 'numpy', 'forecaster': 'batch'}
+
+def test_colony_report_has_one_row_per_forecast_session():
+  df, _ = make_colony(n_subjects = 3, n_sessions = 120)
+  for shared in [False, True]:
+    report = run_colony(df, workers = 2, shared = shared, horizon = 3, pred_index = -6, **RA_KWARGS)
+    assert report.error.isna().all(), report.error.dropna().tolist()
+    assert report.shape[0] == 3 * 3
+    for subjid, sess_df in df.groupby('subjid'):
+      ra = RigAlarm(subjid, horizon = 3, pred_index = -6, **RA_KWARGS)
+      ra.run(sess_df)
+      rows = report[report.subjid == subjid]
+      sessiondates = sess_df.loc[ra.clean_df.index, 'sessiondate'].iloc[-6:-3]
+      assert list(rows.sessiondate.astype(str)) == list(sessiondates.astype(str))
+      assert list(rows.is_anomaly) == [bool(a) for a in ra.horizon_anomaly_]
+      assert list(rows.n_outlier_comp) == [len(c) for c in ra.outlier_comp]
+      assert all(np.array_equal(a, b) for a, b in zip(rows.outlier_comp, ra.outlier_comp))
+
+def test_colony_report_has_one_row_per_subject():
+  df, _ = make_colony(n_subjects = 3, n_sessions = 120)
+  report = run_colony(df, workers = 2, **RA_KWARGS)
+  assert report.error.isna().all()
+  assert list(report.subjid) == sorted(df.subjid.unique())
+
+def test_colony_alerts_are_submitted_from_the_report(tmp_path):
+  df, _ = make_colony(n_subjects = 3, n_sessions = 120)
+  path = str(tmp_path / 'alerts.jsonl')
+  alerts = AlertDispatcher([FileSink(path)], dedup_seconds = 0, only_anomalies = False).start_background()
+  try:
+    report = run_colony(df, workers = 2, alerts = alerts, horizon = 2, pred_index = -3, **RA_KWARGS)
+  finally:
+    alerts.close()
+  assert report.error.isna().all()
+  with open(path) as f:
+    sent = [json.loads(line) for line in f]
+  assert sorted((a['subjid'], a['sessiondate']) for a in sent) == sorted(zip(report.subjid, report.sessiondate.astype(str)))
+  assert all(a['rigid'] is not None for a in sent)
+
+def test_colony_results_are_logged():
+  df, _ = make_colony(n_subjects = 3, n_sessions = 120)
+  for shared in [False, True]:
+    log = ResultLog()
+    report = run_colony(df, workers = 2, shared = shared, result_log = log, horizon = 2, pred_index = -3, **RA_KWARGS)
+    assert len(log) == report.shape[0] == 3 * 2
+    assert list(log['subjid']) == list(report.subjid)
+    assert list(log['is_anomaly']) == list(report.is_anomaly)
+    assert list(log['n_outlier_comp']) == list(report.n_outlier_comp)
+    assert np.all(np.isfinite(log['max_pct_change']))
+
+def test_run_reports_the_clean_session_it_scored():
+  # the last raw session is too short and dropped, the scored one is the last clean session
+  df, _ = make_colony(n_subjects = 1, n_sessions = 120)
+  sess_df = df.copy()
+  sess_df.loc[sess_df.index[-1], 'sess_min'] = 10
+  ra = RigAlarm(sess_df.subjid.iloc[0], **RA_KWARGS)
+  ra.run(sess_df)
+  anomaly = [e for e in ra.metrics.events if e['event'] == 'anomaly']
+  assert [e['sessiondate'] for e in anomaly] == [sess_df.sessiondate.iloc[-2]]
+
+def square_or_crash(key, item, crash_key):
+  if key == crash_key:
+    os._exit(1) # like a segfault in R, the worker dies without a python error
+  return key, item ** 2
+
+def test_pool_retries_the_tasks_of_a_crashed_worker():
+  groups = iter([(key, key + 1) for key in range(8)])
+  results = run_pool(square_or_crash, groups, 2, 4, None, (5,), on_crash = lambda key, item: (key, None))
+  assert sorted(results) == [(key, None if key == 5 else (key + 1) ** 2) for key in range(8)]
@@ -0,0 +1,21 @@
+# the native ForeCA against the R one (backend = 'r') on the example data, skipped without rpy2
+# the numpy side uses R's spectrum estimate (raw periodogram, spectrum_method = 'mvspec')
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('rpy2.robjects')
+
+from smart_alarm.backtest import compare_foreca_backends
+
+EXAMPLE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'example_sessdata.csv')
+MIN_SCORE_CORR = 0.9 # |correlation| of every component's scores
+MAX_OMEGA_DIFF = 2.0 # Omega is in %
+
+@pytest.mark.parametrize('subjid', [1298, 2077, 2105, 2116])
+def test_numpy_foreca_matches_r(subjid):
+  df = pd.read_csv(EXAMPLE_PATH)
+  score_corr, omega_diff = compare_foreca_backends(df[df.subjid == subjid], spectrum_method = 'mvspec')
+  assert np.all(score_corr >= MIN_SCORE_CORR), score_corr
+  assert np.all(omega_diff <= MAX_OMEGA_DIFF), omega_diff
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from smart_alarm.lstm import lstm_chunks
+
+def test_lstm_chunks_train_on_the_window_before_the_chunk():
+  n_sess, w_width, n_steps = 57, 20, 3
+  chunks = list(lstm_chunks(n_sess, w_width, n_steps, refit_every = 10))
+  predicted = np.concatenate([np.arange(n_sess)[test] + n_steps for _, test in chunks])
+  assert list(predicted) == list(range(w_width, n_sess)) # every session after the first window, once
+  for train, test in chunks:
+    targets = np.arange(n_sess)[train] + n_steps
+    first_predicted = test.start + n_steps
+    assert targets.max() == first_predicted - 1 # out of sample
+    assert targets.min() == max(first_predicted - w_width, n_steps) # the rolling window
+
+def test_lstm_walk_forward_predicts_every_session_after_the_first_window():
+  pytest.importorskip('keras')
+  from smart_alarm.lstm import lstm_walk_forward
+  scores = np.random.default_rng(0).normal(size = (45, 2))
+  y_true, y_pred, y_low, y_high, history = lstm_walk_forward(scores, 20, 3, mc_times = 5, epochs = 2, refit_epochs = 1)
+  assert y_true.shape == y_pred.shape == (25, 2)
+  assert np.all(y_low <= y_high) and np.all(y_pred != 0)
+  assert len(history) == 3
@@ -0,0 +1,64 @@
+# Preprocessor.fit + append against RigAlarm.preprocess on the whole history, to the bit
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+from smart_alarm import RigAlarm, Preprocessor
+
+EXAMPLE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'example_sessdata.csv')
+
+def example_subject(subjid):
+  df = pd.read_csv(EXAMPLE_PATH)
+  return df[df.subjid == subjid].copy()
+
+def with_gaps(sess_df):
+  # leading and scattered missing masses, missing total_profit and short sessions
+  sess_df = sess_df.copy()
+  rng = np.random.RandomState(0)
+  sess_df.loc[sess_df.index[:4], 'mass'] = np.nan
+  sess_df.loc[sess_df.index[rng.rand(len(sess_df)) < 0.1], 'mass'] = np.nan
+  sess_df.loc[sess_df.index[[1, 10, 20]], 'total_profit'] = np.nan
+  sess_df.loc[sess_df.index[[2, 11, 30]], 'sess_min'] = 20
+  sess_df.loc[sess_df.index[rng.rand(len(sess_df)) < 0.05], 'BotCin'] = np.nan
+  return sess_df
+
+def assert_same_as_preprocess(preprocessor, sess_df):
+  ra = RigAlarm(sess_df.subjid.iloc[0])
+  expected = ra.preprocess(sess_df)
+  assert preprocessor.array.dtype == expected.dtype
+  assert np.array_equal(preprocessor.array, expected)
+  assert preprocessor.labels == list(ra.clean_df.index)
+  assert preprocessor.columns == list(ra.clean_df.columns)
+
+@pytest.mark.parametrize('gaps', [False, True])
+@pytest.mark.parametrize('n_history', [0, 3, 50, 200])
+def test_fit_then_append_matches_preprocess(gaps, n_history):
+  sess_df = example_subject(2077)
+  if gaps:
+    sess_df = with_gaps(sess_df)
+  preprocessor = Preprocessor()
+  preprocessor.fit(sess_df.iloc[:n_history])
+  for label, row in sess_df.iloc[n_history:].iterrows():
+    preprocessor.append(row.to_dict(), label = label)
+  assert_same_as_preprocess(preprocessor, sess_df)
+
+def test_all_masses_missing_so_far():
+  sess_df = example_subject(1298)
+  sess_df['mass'] = np.nan
+  sess_df.loc[sess_df.index[40]:, 'mass'] = 250.0
+  preprocessor = Preprocessor()
+  preprocessor.fit(sess_df.iloc[:20])
+  assert_same_as_preprocess(preprocessor, sess_df.iloc[:20])
+  for label, row in sess_df.iloc[20:].iterrows():
+    preprocessor.append(row.to_dict(), label = label)
+  assert_same_as_preprocess(preprocessor, sess_df)
+
+def test_filtered_rows_are_not_appended():
+  sess_df = example_subject(2105)
+  preprocessor = Preprocessor()
+  preprocessor.fit(sess_df)
+  row = sess_df.iloc[-1].to_dict()
+  assert preprocessor.append(dict(row, total_profit = None)) is None
+  assert preprocessor.append(dict(row, sess_min = 30)) is None
+  assert preprocessor.size == RigAlarm(2105).preprocess(sess_df).shape[0]
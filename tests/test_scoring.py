@@ -0,0 +1,29 @@
+# the vectorized scoring of a walk-forward backtest against RigAlarm.detect_outliers, one session at a time
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+from smart_alarm import RigAlarm
+from smart_alarm.backtest import collect_walk_forward
+from smart_alarm.scoring import score_rigalarm
+
+EXAMPLE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'example_sessdata.csv')
+
+@pytest.mark.parametrize('subjid', [1298, 2077, 2105, 2116])
+def test_score_rigalarm_matches_detect_outliers(subjid):
+  df = pd.read_csv(EXAMPLE_PATH)
+  ra = RigAlarm(subjid, backend = 'numpy', forecaster = 'batch')
+  ra.foreCA(ra.preprocess(df[df.subjid == subjid]))
+  pred_index, y_true, _, y_low, y_high, converged = collect_walk_forward(ra)
+  scores = score_rigalarm(ra, pred_index, y_true, y_low, y_high, converged)
+  assert len(pred_index) > 0
+  for k, index in enumerate(pred_index):
+    ra.pred_index = int(index)
+    ra.arima_predict()
+    ra.is_anomaly = False # detect_outliers only ever sets it
+    ra.detect_outliers()
+    assert list(ra.outlier_comp) == list(np.flatnonzero(scores['outliers'][k]) + 1), index
+    assert scores['votes'][k] == len(ra.outlier_comp)
+    np.testing.assert_allclose(ra.abs_conf_diff_, scores['conf_dist'][k][scores['outliers'][k]], rtol = 1e-9)
+    assert scores['is_anomaly'][k] == ra.is_anomaly, index
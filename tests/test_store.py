@@ -0,0 +1,25 @@
+import numpy as np
+
+from smart_alarm import ForeCAModelStore, RigAlarm, run_colony
+from smart_alarm.synthetic import make_colony
+
+def test_separate_store_instances_keep_each_others_models(tmp_path):
+  # what the workers of run_colony do: every task has its own copy of the store
+  model = {'projection': np.eye(3)}
+  for subjid in [1, 2, 3]:
+    ForeCAModelStore(str(tmp_path)).save(subjid, model, {'n_fit_sessions': subjid})
+  store = ForeCAModelStore(str(tmp_path))
+  for subjid in [1, 2, 3]:
+    loaded, meta = store.load(subjid)
+    assert meta['n_fit_sessions'] == subjid
+    assert np.array_equal(loaded['projection'], model['projection'])
+
+def test_colony_models_are_reused_on_the_next_run(tmp_path):
+  df, _ = make_colony(n_subjects = 4, n_sessions = 120)
+  ra_kwargs = {'backend': 'numpy', 'forecaster': 'batch', 'model_store': ForeCAModelStore(str(tmp_path))}
+  report = run_colony(df, workers = 2, **ra_kwargs)
+  assert report.error.isna().all()
+  for subjid, sess_df in df.groupby('subjid'):
+    ra = RigAlarm(subjid, **ra_kwargs)
+    ra.fit_or_project(ra.preprocess(sess_df), sess_df.loc[ra.clean_df.index, 'sessid'].to_numpy())
+    assert ra.refit_reason is None